@@ -1,9 +1,11 @@
-from sqlalchemy import create_engine, Column, String, Integer, Float, DateTime, ForeignKey, Boolean
+from sqlalchemy import bindparam, create_engine, event, func, inspect, update, Column, String, Integer, Float, DateTime, ForeignKey, Boolean, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, scoped_session, relationship, backref
+from sqlalchemy.pool import QueuePool
 import datetime
 import uuid
 import logging
+import os
 logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
 
 # Define the base class for models
@@ -12,11 +14,70 @@ Base = declarative_base()
 # Define the database URL
 DB_URL = "sqlite:///instance/main.db"
 
-# Create a single engine instance (thread-safe)
-engine = create_engine(DB_URL, echo=False)
+# Create a single engine instance (thread-safe) backed by a shared connection pool
+engine = create_engine(
+    DB_URL,
+    echo=bool(os.environ.get("SQL_ECHO")),  # SQL logging is opt-in, it formats every statement and its params
+    poolclass=QueuePool,
+    pool_size=10,
+    max_overflow=20,
+    # sqlite3 keeps this many prepared statements per connection (default 128)
+    connect_args={"check_same_thread": False, "cached_statements": 256},
+    query_cache_size=1200,
+)
+
+# WAL lets readers run alongside the single writer; synchronous=NORMAL skips the fsync per commit.
+# An in-memory database has no WAL, so it only gets the per-connection settings.
+_IN_MEMORY = engine.url.database in (None, "", ":memory:")
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    if not _IN_MEMORY:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # Truncate the WAL file back to this size after checkpoints, so a burst of writes doesn't leave it huge
+        cursor.execute("PRAGMA journal_size_limit=67108864")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA cache_size=-65536")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+# Read-only connections for lookups on hot paths. They never take the write lock and are
+# handed out most-recently-used first, so a few warm connections serve every thread.
+READ_POOL_SIZE = min(8, os.cpu_count() or 1)
+if _IN_MEMORY:
+    # There is no file to reopen read-only; a new in-memory connection would be a separate, empty database
+    read_engine = engine
+else:
+    read_engine = create_engine(
+        f"sqlite:///file:{engine.url.database}?mode=ro&uri=true",
+        poolclass=QueuePool,
+        pool_size=READ_POOL_SIZE,
+        max_overflow=0,
+        pool_use_lifo=True,
+        connect_args={"check_same_thread": False, "cached_statements": 256},
+    )
+
+    @event.listens_for(read_engine, "connect")
+    def _set_sqlite_read_pragmas(dbapi_connection, connection_record):
+        # journal_mode is a property of the file and is set by the writable engine
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.execute("PRAGMA cache_size=-65536")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
 
 # Create a configured "Session" class
-SessionLocal = sessionmaker(bind=engine)
+SessionFactory = sessionmaker(bind=engine)
+
+# Thread-local sessions for the server threads; call SessionLocal.remove() when a thread is done
+SessionLocal = scoped_session(SessionFactory)
+
+# Sessions for lookups only, on read_engine: they never hold a writer connection or the write lock
+ReadSession = sessionmaker(bind=read_engine)
 
 # Models
 class Vehicle(Base):
@@ -26,12 +87,19 @@ class Vehicle(Base):
     latitude = Column(Float)
     longitude = Column(Float)
     status = Column(String, nullable=False, default="IDLE")
+    # 16-byte salt + 32-byte BLAKE2b digest; NULL for vehicles registered without a password
+    password_hash = Column(LargeBinary, nullable=True)
+
+    __table_args__ = (Index("ix_vehicle_latlon", "latitude", "longitude"),)
 
 class Session(Base):
     __tablename__ = 'sessions'
     session_id = Column(String, primary_key=True)
     vehicle_id = Column(String, ForeignKey('vehicles.vehicle_id'), nullable=False)
     expires_at = Column(DateTime, nullable=False)
+    # UNIX seconds, cheap to compare on the hot path. Nullable so ensure_columns() can add it to databases
+    # created before it existed; a NULL expiry (only on those older rows) counts as already expired.
+    expires_at_ts = Column(Integer, nullable=True)
 
 class Location(Base):
     __tablename__ = 'locations'
@@ -40,6 +108,9 @@ class Location(Base):
     longitude = Column(Float, nullable=False)
     latitude = Column(Float, nullable=False)
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+
+    # Serves "latest positions for vehicle X" and time-range lookups without a full scan
+    __table_args__ = (Index("ix_loc_vid_ts", "vehicle_id", "timestamp"),)
     
 class Place(Base):
     __tablename__ = 'places'
@@ -52,7 +123,9 @@ class Place(Base):
     stay_time_seconds = Column(Integer, nullable=True)
     pass_through = Column(Boolean, default=False, nullable=False)
 
-    occupants = relationship("PlaceOccupancy", backref="place")
+    # Never lazy-load: callers must ask for these with selectinload()/joinedload(),
+    # otherwise touching them raises instead of issuing one SELECT per row
+    occupants = relationship("PlaceOccupancy", backref=backref("place", lazy="raise"), lazy="raise")
 
     def __repr__(self):
         return f"<Place(id={self.place_id}, name='{self.name}', type='{self.type}')>"
@@ -62,10 +135,10 @@ class PlaceOccupancy(Base):
     __tablename__ = 'place_occupancy'
 
     occupancy_id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    vehicle_id = Column(String, nullable=False)  # e.g., "B101"
-    place_id = Column(String, ForeignKey('places.place_id'), nullable=False)
+    vehicle_id = Column(String, nullable=False, index=True)  # e.g., "B101"
+    place_id = Column(String, ForeignKey('places.place_id'), nullable=False, index=True)
     entered_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
-    leave_after = Column(DateTime, nullable=False)
+    leave_after = Column(DateTime, nullable=False, index=True)  # expiry sweeps are range scans on this
 
     def __repr__(self):
         return f"<Occupancy(vehicle={self.vehicle_id}, place={self.place_id}, leave_after={self.leave_after})>"
@@ -75,15 +148,64 @@ class Routes(Base):
 
     vehicle_id = Column(String, primary_key=True)
     step_index = Column(Integer, primary_key=True)  # 0, 1, 2, ...
-    place_id = Column(String, ForeignKey("places.place_id"), nullable=False)
+    place_id = Column(String, ForeignKey("places.place_id"), nullable=False, index=True)
 
     def __repr__(self):
         return f"<RouteStep(vehicle={self.vehicle_id}, step={self.step_index}, place={self.place_id})>"
 
+# Core INSERT for the append-only locations table, compiled once and reused by the hot write path
+LOCATION_INSERT = Location.__table__.insert()
+
+# Core UPDATE of a vehicle's last known state, run as one executemany per batch; a NULL status keeps the stored one
+_vehicles = Vehicle.__table__
+VEHICLE_STATE_UPDATE = (
+    update(_vehicles)
+    .where(_vehicles.c.vehicle_id == bindparam("b_vehicle_id"))
+    .values(
+        latitude=bindparam("b_latitude"),
+        longitude=bindparam("b_longitude"),
+        status=func.coalesce(bindparam("b_status"), _vehicles.c.status),
+    )
+)
+
 # Initialize the database
 def init_db():
     Base.metadata.create_all(engine)
+    refresh_planner_stats()
+
+# Add any indexes missing from a database created before they were defined; create_all skips existing tables
+def ensure_indexes():
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    refresh_planner_stats()
+
+# Add columns missing from a database created before they were defined; create_all skips existing tables.
+# SQLite can only add a NOT NULL column together with a default for the existing rows, so a NOT NULL column
+# without a server_default is a schema mismatch this can't repair, and startup fails instead of the first query.
+def ensure_columns():
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_sql = f'"{column.name}" {column.type.compile(engine.dialect)}'
+                if not column.nullable:
+                    if column.server_default is None:
+                        raise RuntimeError(f"{table.name}.{column.name} is missing from the database and is NOT NULL "
+                                           "without a server_default, so it can't be added in place; migrate the table")
+                    default = engine.dialect.ddl_compiler(engine.dialect, None).get_column_default_string(column)
+                    column_sql += f" NOT NULL DEFAULT {default}"
+                conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN {column_sql}')
+
+# Let SQLite gather the statistics its query planner uses to choose between indexes.
+# Unlike a bare ANALYZE, this only re-analyzes tables whose stats are missing or stale.
+def refresh_planner_stats():
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA optimize")
 
 # Utility function to get a new session
 def get_db_session():
-    return SessionLocal()
\ No newline at end of file
+    return SessionFactory()
\ No newline at end of file
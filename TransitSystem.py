@@ -1,65 +1,344 @@
-from Database import Vehicle, Session as DBSession, Location, get_db_session, init_db, DB_URL
+from Database import Vehicle, Session as DBSession, LOCATION_INSERT, VEHICLE_STATE_UPDATE, engine, read_engine, init_db, ensure_columns, ensure_indexes, DB_URL
+from sqlalchemy import bindparam, literal, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from abc import ABC, abstractmethod
-from Vehicle import VehicleType
+from Vehicle import PREFIX_MAP
+from logs import get_logger
+from places import haversine_m, sweep_expired
+from protocol import FrameError, OP_BEACON, OP_UPDATE_LOCATION, decode_beacon, decode_update_location, encode_frame, pop_frames
+import array
+import collections
+import concurrent.futures
+import functools
+import logging
+import queue
+import re
+import selectors
 import threading
 import datetime
+import hashlib
+import hmac
 import socket
-import uuid
 import time
 import os
 
+# Written to stdout by the shared listener thread, so client and UDP threads never block on console I/O
+logger = get_logger("server")
+
+SESSION_LIFETIME_SECONDS = 3600
+_OP_UPDATE_LOCATION = bytes([OP_UPDATE_LOCATION])
+_OP_BEACON = bytes([OP_BEACON])
+
+# UDP beacon: `<vehicle_id>/<longitude>/<latitude>`, parsed straight from the datagram bytes
+_UDP_LOCATION_RE = re.compile(rb"^([A-Za-z0-9]+)/(-?\d+(?:\.\d*)?)/(-?\d+(?:\.\d*)?)\s*$")
+
+# Session tokens are `<vehicle_id>.<expires_ts>.<nonce>.<hmac>` so they can be validated without a DB lookup.
+# Set TRANSIT_SESSION_SECRET to keep tokens valid across server restarts.
+SESSION_SECRET = os.environ.get("TRANSIT_SESSION_SECRET", "").encode() or os.urandom(32)
+
+def _sign(body: str) -> str:
+    return hmac.new(SESSION_SECRET, body.encode(), hashlib.sha256).hexdigest()
+
+# Statements built once, so each call reuses SQLAlchemy's compiled form and sqlite3's prepared statement
+VEHICLE_EXISTS = select(literal(1)).where(Vehicle.vehicle_id == bindparam("vehicle_id")).limit(1)
+VEHICLE_PASSWORD_HASH = select(Vehicle.password_hash).where(Vehicle.vehicle_id == bindparam("vehicle_id"))
+SESSION_INSERT = DBSession.__table__.insert()
+VEHICLE_REGISTER = (
+    sqlite_insert(Vehicle.__table__)
+    .on_conflict_do_nothing(index_elements=["vehicle_id"])
+    .returning(Vehicle.__table__.c.vehicle_id)
+)
+
+# Vehicles are never deleted, so a positive lookup can be remembered for the life of the process.
+# Misses are not cached because vehicles may also be inserted by the simulation scripts.
+_known_vehicles: set[str] = set()
+
+# Tokens whose signature already checked out, so each one is parsed and HMAC'd once rather than
+# on every UPDATE_LOCATION. Only correctly signed tokens get in, and expiry is still checked per use.
+SESSION_CACHE_SIZE = 10000
+_verified_sessions: dict[str, tuple[str, int]] = {}  # session_id -> (vehicle_id, expires_ts)
+
+def _remember_session(session_id: str, vehicle_id: str, expires_ts: int) -> None:
+    if len(_verified_sessions) >= SESSION_CACHE_SIZE:
+        # Crude bound: live sessions are simply verified again on their next use
+        _verified_sessions.clear()
+    _verified_sessions[session_id] = (vehicle_id, expires_ts)
+
+PASSWORD_SALT_SIZE = 16  # BLAKE2b's maximum salt length
+
+def _hash_password(password: str, salt: bytes | None = None) -> bytes:
+    """Salted BLAKE2b of a vehicle password, returned as salt + digest."""
+    salt = salt or os.urandom(PASSWORD_SALT_SIZE)
+    return salt + hashlib.blake2b(password.encode(), digest_size=32, salt=salt).digest()
+
+class _LocationBatch:
+    """Locations queued together, stored by column so each coordinate is a packed double rather than a float object."""
+    __slots__ = ("vehicle_ids", "longitudes", "latitudes", "timestamp")
+
+    def __init__(self):
+        self.vehicle_ids: list[str] = []
+        self.longitudes = array.array("d")
+        self.latitudes = array.array("d")
+        self.timestamp: datetime.datetime | None = None
+
+    def __len__(self) -> int:
+        return len(self.vehicle_ids)
+
+    def append(self, vehicle_id: str, longitude: float, latitude: float) -> None:
+        self.vehicle_ids.append(vehicle_id)
+        self.longitudes.append(longitude)
+        self.latitudes.append(latitude)
+
+    def rows(self) -> list[dict]:
+        timestamp = self.timestamp
+        return [
+            {"vehicle_id": vehicle_id, "longitude": longitude, "latitude": latitude, "timestamp": timestamp}
+            for vehicle_id, longitude, latitude in zip(self.vehicle_ids, self.longitudes, self.latitudes)
+        ]
+
+
 class Database:
+    WRITE_QUEUE_SIZE = 10000
+    WRITE_BATCH_SIZE = 500  # locations and state updates written per transaction, give or take one queued batch
+    MIN_MOVE_METERS = 5.0  # closer than this to the last stored fix counts as "not moved"
+    MAX_SKIP_SECONDS = 10.0  # still store a stationary vehicle at least this often
+    CLOSE_TIMEOUT_SECONDS = 2.0  # how long close() waits for the writer to take the stop marker and finish
+
     def __init__(self):
-        self.session = get_db_session()
+        self._last_loc: dict[str, tuple[float, float, float]] = {}
+        self._last_loc_lock = threading.Lock()
+        # Writes from client threads and the location writer take turns here instead of
+        # contending for SQLite's file lock, whose busy handler backs off by sleeping
+        self._write_lock = threading.Lock()
+
+        # All location and vehicle state writes go through one writer thread so SQLite sees a single ordered writer.
+        # Queue items are _LocationBatch objects or (vehicle_id, latitude, longitude, status) state tuples.
+        self._write_q: queue.Queue = queue.Queue(maxsize=self.WRITE_QUEUE_SIZE)
+        self._stop_writing = threading.Event()  # set by close() when the stop marker didn't fit in the queue
+        self._writer_thread = threading.Thread(target=self._write_locations, daemon=True)
+        self._writer_thread.start()
+
+    def close(self):
+        deadline = time.monotonic() + self.CLOSE_TIMEOUT_SECONDS
+        try:
+            # Queued behind the pending writes, so they are written first
+            self._write_q.put(None, timeout=self.CLOSE_TIMEOUT_SECONDS)
+        except queue.Full:
+            # The writer is stuck or far behind; have it stop after its current batch rather than hang shutdown
+            self._stop_writing.set()
+        self._writer_thread.join(timeout=max(0.0, deadline - time.monotonic()))
 
     def vehicle_exists(self, vehicle_id: str) -> bool:
-        return self.session.query(Vehicle).filter_by(vehicle_id=vehicle_id).first() is not None
+        if vehicle_id in _known_vehicles:
+            return True
+        with read_engine.connect() as conn:
+            exists = conn.execute(VEHICLE_EXISTS, {"vehicle_id": vehicle_id}).first() is not None
+        if exists:
+            _known_vehicles.add(vehicle_id)
+        return exists
 
     def create_session(self, vehicle_id: str) -> str:
-        session_id = str(uuid.uuid4())
-        expires_at = datetime.datetime.now() + datetime.timedelta(hours=1)
-        new_session = DBSession(session_id=session_id, vehicle_id=vehicle_id, expires_at=expires_at)
-        self.session.add(new_session)
-        self.session.commit()
+        expires_ts = int(time.time()) + SESSION_LIFETIME_SECONDS
+        body = f"{vehicle_id}.{expires_ts}.{os.urandom(16).hex()}"
+        session_id = f"{body}.{_sign(body)}"
+        # The row is kept for auditing/revocation; validation never reads it back
+        expires_at = datetime.datetime.fromtimestamp(expires_ts)
+        with self._write_lock, engine.begin() as conn:
+            conn.execute(SESSION_INSERT, {
+                "session_id": session_id,
+                "vehicle_id": vehicle_id,
+                "expires_at": expires_at,
+                "expires_at_ts": expires_ts,
+            })
+        _remember_session(session_id, vehicle_id, expires_ts)
         return session_id
 
     def validate_session(self, session_id: str, expected_vehicle_id: str) -> tuple[bool, str]:
-        db_session = self.session.query(DBSession).filter_by(session_id=session_id).first()
-        if not db_session:
-            return False, "INVALID_SESSION"
+        cached = _verified_sessions.get(session_id)
+        if cached is not None:
+            vehicle_id, expires_ts = cached
+        else:
+            try:
+                body, signature = session_id.rsplit(".", 1)
+                vehicle_id, expires_ts, _nonce = body.rsplit(".", 2)
+                expires_ts = int(expires_ts)
+            except ValueError:
+                return False, "INVALID_SESSION"
 
-        if db_session.vehicle_id != expected_vehicle_id:
+            if not hmac.compare_digest(signature, _sign(body)):
+                return False, "INVALID_SESSION"
+            _remember_session(session_id, vehicle_id, expires_ts)
+
+        if vehicle_id != expected_vehicle_id:
             return False, "INVALID_SESSION"
 
-        if datetime.datetime.now() > db_session.expires_at:
+        if time.time() > expires_ts:
+            _verified_sessions.pop(session_id, None)
             return False, "SESSION_EXPIRED"
 
         return True, "VALID"
 
     def record_location(self, vehicle_id: str, longitude: float, latitude: float) -> bool:
+        return self.record_locations([(vehicle_id, longitude, latitude)])
+
+    def record_locations(self, locations: list[tuple[str, float, float]]) -> bool:
+        """Queue (vehicle_id, longitude, latitude) fixes for the writer thread; returns False if the queue is full.
+
+        The fixes that are kept go on the queue as one batch sharing one timestamp, which is only
+        built if any are kept, so updates from vehicles that haven't moved never build a datetime.
+        """
+        now = time.monotonic()
+        batch = _LocationBatch()
+        with self._last_loc_lock:
+            for vehicle_id, longitude, latitude in locations:
+                if self._has_moved(vehicle_id, latitude, longitude, now):
+                    batch.append(vehicle_id, longitude, latitude)
+        if not batch:
+            return True
+        batch.timestamp = datetime.datetime.utcnow()
         try:
-            new_location = Location(vehicle_id=vehicle_id, longitude=longitude, latitude=latitude)
-            self.session.add(new_location)
-            self.session.commit()
+            self._write_q.put_nowait(batch)
             return True
-        except Exception as e:
-            self.session.rollback()
-            print(f"Error recording location: {e}")
+        except queue.Full:
+            logger.error("Error recording location: write queue is full")
+            return False
+
+    def _has_moved(self, vehicle_id: str, latitude: float, longitude: float, now: float) -> bool:
+        """Skip writes for vehicles that haven't moved since their last stored location."""
+        prev = self._last_loc.get(vehicle_id)
+        if (prev and now - prev[2] < self.MAX_SKIP_SECONDS
+                and haversine_m(prev[0], prev[1], latitude, longitude) < self.MIN_MOVE_METERS):
             return False
+        self._last_loc[vehicle_id] = (latitude, longitude, now)
+        return True
 
-    def register_vehicle(self, vehicle_id: str, vehicle_type: str) -> bool:
+    def _write_locations(self):
+        running = True
+        while running and not self._stop_writing.is_set():
+            batch = []
+            pending = 0
+            item = self._write_q.get()
+            while True:
+                batch.append(item)
+                pending += len(item) if isinstance(item, _LocationBatch) else 1
+                if pending >= self.WRITE_BATCH_SIZE:
+                    break
+                try:
+                    item = self._write_q.get_nowait()
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+                batch = [row for row in batch if row is not None]
+            if not batch:
+                continue
+
+            locations = []
+            states: dict[str, dict] = {}  # only each vehicle's latest state in the batch is written
+            for item in batch:
+                if isinstance(item, _LocationBatch):
+                    locations.extend(item.rows())
+                else:
+                    vehicle_id, latitude, longitude, status = item
+                    if status is None and vehicle_id in states:
+                        status = states[vehicle_id]["b_status"]
+                    states[vehicle_id] = {
+                        "b_vehicle_id": vehicle_id,
+                        "b_latitude": latitude,
+                        "b_longitude": longitude,
+                        "b_status": status,
+                    }
+            try:
+                with self._write_lock, engine.begin() as conn:
+                    if locations:
+                        conn.execute(LOCATION_INSERT, locations)
+                    if states:
+                        conn.execute(VEHICLE_STATE_UPDATE, list(states.values()))
+            except Exception as e:
+                logger.error("Error recording %d location(s) and %d vehicle state(s): %s", len(locations), len(states), e)
+
+    def update_vehicle_state(self, vehicle_id: str, latitude: float, longitude: float, status: str | None) -> bool:
+        """Queue a vehicle's latest position and status for the writer thread; returns False if the queue is full."""
         try:
-            new_vehicle = Vehicle(vehicle_id=vehicle_id, vehicle_type=vehicle_type)
-            self.session.add(new_vehicle)
-            self.session.commit()
+            self._write_q.put_nowait((vehicle_id, latitude, longitude, status or None))
             return True
-        except Exception as e:
-            self.session.rollback()
-            print(f"Error registering vehicle: {e}")
+        except queue.Full:
+            logger.error("Error updating vehicle state: write queue is full")
+            return False
+
+    def password_correct(self, vehicle_id: str, password: str | None) -> bool:
+        """Vehicles registered without a password accept any; the rest need a matching one."""
+        with read_engine.connect() as conn:
+            stored = conn.execute(VEHICLE_PASSWORD_HASH, {"vehicle_id": vehicle_id}).scalar()
+        if stored is None:
+            return True
+        if password is None:
             return False
+        # Constant-time comparison of the digests; the plaintext is never stored
+        return hmac.compare_digest(stored, _hash_password(password, stored[:PASSWORD_SALT_SIZE]))
+
+    def register_vehicle(self, vehicle_id: str, vehicle_type: str, password: str | None = None) -> str:
+        """Insert the vehicle unless it exists; returns "REGISTERED", "EXISTS" or "ERROR"."""
+        if vehicle_id in _known_vehicles:
+            return "EXISTS"
+        password_hash = _hash_password(password) if password else None
+        try:
+            # One statement both checks and inserts, so two concurrent REGISTERs can't both win
+            with self._write_lock, engine.begin() as conn:
+                inserted = conn.execute(VEHICLE_REGISTER, {
+                    "vehicle_id": vehicle_id,
+                    "vehicle_type": vehicle_type,
+                    "password_hash": password_hash,
+                }).first()
+        except Exception as e:
+            logger.error("Error registering vehicle: %s", e)
+            return "ERROR"
+        _known_vehicles.add(vehicle_id)
+        return "REGISTERED" if inserted else "EXISTS"
+
+
+RECV_BUFFER_SIZE = 64 * 1024
+# Reads land in one reusable buffer per worker thread rather than one per connection,
+# so the buffer can be large enough to take a whole burst of frames in one recv()
+_recv_buffers = threading.local()
+
+def _recv_buffer() -> memoryview:
+    view = getattr(_recv_buffers, "view", None)
+    if view is None:
+        view = _recv_buffers.view = memoryview(bytearray(RECV_BUFFER_SIZE))
+    return view
+
+
+class _ClientConnection:
+    """A connected client, its partially received frames and the replies not yet sent."""
+    __slots__ = ("conn", "addr", "buf", "out")
+
+    def __init__(self, conn: socket.socket, addr):
+        self.conn = conn
+        self.addr = addr
+        self.buf = bytearray()
+        self.out = bytearray()
+
+    def sendall(self, data: bytes) -> None:
+        """Queue a framed reply; it is written once the frames at hand have been handled."""
+        self.out += data
+
+    def flush(self) -> bool:
+        """Write as much queued output as the socket takes without blocking; True once it's all sent."""
+        while self.out:
+            try:
+                sent = self.conn.send(self.out)
+            except BlockingIOError:
+                return False
+            del self.out[:sent]
+        return True
 
 
 class TransitSystem:
+    MAX_CLIENT_WORKERS = 64
+    OCCUPANCY_SWEEP_SECONDS = 30  # how often stays that ran out are cleared from place_occupancy
+    SOCKET_BUFFER_SIZE = 4_000_000  # bytes; absorbs bursts of batched beacons and status frames
+
     def __init__(self, addr: str, tcp_port: int, udp_port: int):
         # --- Database Initialization Check ---
         # Extract the path from the DB_URL (sqlite:///instance/main.db -> instance/main.db)
@@ -72,53 +351,142 @@ class TransitSystem:
             self._log("Database initialized.")
         else:
             self._log(f"Database file found at {db_path}.")
+            ensure_columns()
+            ensure_indexes()
         # --- End Database Check ---
 
         self.db = Database()
         self.tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Set before listen() so accepted connections inherit it and the window scale is negotiated
+        self.tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.SOCKET_BUFFER_SIZE)
+        self.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.SOCKET_BUFFER_SIZE)
         self.tcp_socket.bind((addr, tcp_port))
         self.udp_socket.bind((addr, udp_port))
-        self.tcp_socket.settimeout(1.0)
         self.tcp_socket.listen(5)
         self._log(f'TCP Server listening on {addr}:{tcp_port}')
         self._log(f'UDP Server listening on {addr}:{udp_port}')
 
         self.running = False
         self.udp_thread = None
+        self._sweep_stop = threading.Event()
+        # One thread waits on the listener and every client socket; a connection only holds one of
+        # these workers while it has frames to handle, so idle vehicles cost no thread
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.MAX_CLIENT_WORKERS, thread_name_prefix="client"
+        )
+        self._selector = selectors.DefaultSelector()
+        self._clients: set[_ClientConnection] = set()
+        self._clients_lock = threading.Lock()
+        # Workers hand finished connections back to the selector thread, which owns the selector
+        self._rearm: collections.deque[_ClientConnection] = collections.deque()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
 
     def _log(self, *args):
-        msg = " ".join(map(str, args))
-        print('Server | ' + msg)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('Server | %s', " ".join(map(str, args)))
 
     def start(self):
         self.running = True
         self.udp_thread = threading.Thread(target=self._handle_udp_location, daemon=True)
         self.udp_thread.start()
         self._log("UDP listener thread started.")
+        self._sweep_stop.clear()
+        threading.Thread(target=self._sweep_occupancies, daemon=True, name="occupancy-sweeper").start()
 
+        self.tcp_socket.setblocking(False)
+        self._selector.register(self.tcp_socket, selectors.EVENT_READ)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
         try:
             while self.running:
-                try:
-                    conn, addr = self.tcp_socket.accept()
-                    threading.Thread(
-                        target=self.handle_client, args=(conn, addr), daemon=True
-                    ).start()
-                except socket.timeout:
-                    continue
-                except Exception as e:
-                    if self.running:
-                        self._log(f'Error connecting: {e}')
-                    break
+                for key, mask in self._selector.select(timeout=1.0):
+                    if key.fileobj is self.tcp_socket:
+                        self._accept_clients()
+                    elif key.fileobj is self._wake_r:
+                        self._rearm_clients()
+                    elif mask & selectors.EVENT_WRITE:
+                        self._flush_client(key.data)
+                    else:
+                        # Not watched again until a worker has handled what's there, so a
+                        # connection's frames are handled (and answered) in order
+                        self._selector.unregister(key.fileobj)
+                        self._pool.submit(self.handle_client, key.data)
         except KeyboardInterrupt:
             self._log('Server stopping...')
+        except Exception as e:
+            if self.running:
+                self._log(f'Error in connection loop: {e}')
         finally:
             self.stop()
+            self._selector.close()
+            with self._clients_lock:
+                clients = list(self._clients)
+                self._clients.clear()
+            for client in clients:
+                client.conn.close()
+            self._wake_r.close()
+            self._wake_w.close()
+
+    def _sweep_occupancies(self):
+        # Vehicles leave places themselves, but one that crashed or was killed mid-stay leaves its row
+        # behind, and capacity counts every row, so the place would stay full for good
+        while not self._sweep_stop.wait(self.OCCUPANCY_SWEEP_SECONDS):
+            try:
+                removed = sweep_expired()
+            except Exception as e:
+                self._log(f"Error sweeping expired occupancies: {e}")
+                continue
+            if removed:
+                self._log(f"Cleared {len(removed)} expired place occupancies")
+
+    def _accept_clients(self):
+        while True:
+            try:
+                conn, addr = self.tcp_socket.accept()
+            except BlockingIOError:
+                return
+            # Non-blocking, so a client that stops reading its replies can't hold a worker in send();
+            # whatever doesn't fit is written by this thread once the socket is writable again
+            conn.setblocking(False)
+            # Replies are small frames too; send them without waiting on Nagle
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = _ClientConnection(conn, addr)
+            with self._clients_lock:
+                self._clients.add(client)
+            self._log(f'[{addr}] Client connected')
+            self._selector.register(conn, selectors.EVENT_READ, client)
+
+    def _rearm_clients(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self._rearm:
+            client = self._rearm.popleft()
+            if client.conn.fileno() != -1:
+                # Nothing more is read from a client until its earlier replies are out
+                events = selectors.EVENT_WRITE if client.out else selectors.EVENT_READ
+                self._selector.register(client.conn, events, client)
+
+    def _flush_client(self, client: _ClientConnection):
+        try:
+            if not client.flush():
+                return
+        except OSError as e:
+            self._log(f'[{client.addr}] Socket Error: {e}')
+            self._selector.unregister(client.conn)
+            self._close_client(client)
+            return
+        self._selector.modify(client.conn, selectors.EVENT_READ, client)
 
     def stop(self):
         if not self.running:
             return
         self.running = False
+        self._sweep_stop.set()
         self._log('Closing server...')
         try:
             self.tcp_socket.shutdown(socket.SHUT_RDWR)
@@ -136,90 +504,217 @@ class TransitSystem:
         except Exception as e:
             self._log(f"Error closing UDP socket: {e}")
 
+        # Wake the connection loop so it stops and closes the client sockets
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            pass
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
         if self.udp_thread and self.udp_thread.is_alive():
              self._log("Waiting for UDP thread to finish...")
              self.udp_thread.join(timeout=2.0)
              if self.udp_thread.is_alive():
                  self._log("UDP thread did not finish cleanly.")
 
+        self.db.close()
         self._log('Server stopped.')
 
     def _handle_udp_location(self):
-        while self.running:
+        selector = selectors.DefaultSelector()
+        self.udp_socket.setblocking(False)
+        selector.register(self.udp_socket, selectors.EVENT_READ)
+        try:
+            while self.running:
+                try:
+                    if selector.select(timeout=1.0):
+                        self._drain_udp_socket()
+                except (OSError, ValueError) as e:
+                    if self.running:
+                        self._log(f"[UDP Listener] Socket Error: {e}")
+                        time.sleep(1)
+                    else:
+                        break
+                except Exception as e:
+                    self._log(f"[UDP Listener] Unexpected error: {e}")
+                    time.sleep(1)
+        finally:
+            selector.close()
+            self._log("[UDP Listener] Socket closed, shutting down.")
+
+    def _drain_udp_socket(self):
+        """Read every datagram currently queued on the UDP socket and record them as one batch."""
+        parsed = []
+        while True:
             try:
                 data, addr = self.udp_socket.recvfrom(1024)
-                msg = data.decode().strip()
-                self._log(f"[UDP {addr}] Received: {msg}")
-
-                parts = msg.split('/')
-                if len(parts) == 3:
-                    vehicle_id, lon_str, lat_str = parts
-                    try:
-                        longitude = float(lon_str)
-                        latitude = float(lat_str)
-                        if self.db.record_location(vehicle_id, longitude, latitude):
-                            self._log(f"[UDP {addr}] Recorded location for {vehicle_id}: ({longitude}, {latitude})")
-                        else:
-                            self._log(f"[UDP {addr}] Failed to record location for {vehicle_id}")
-                    except ValueError:
-                        self._log(f"[UDP {addr}] Invalid location format in message: {msg}")
-                    except Exception as e:
-                         self._log(f"[UDP {addr}] Error processing location for {vehicle_id}: {e}")
-                else:
-                    self._log(f"[UDP {addr}] Invalid UDP message format: {msg}")
+            except BlockingIOError:
+                break
+            location = self._parse_udp_location(data, addr)
+            if location:
+                parsed.append(location)
+        if not parsed:
+            return
 
-            except socket.error as e:
-                if self.running:
-                    self._log(f"[UDP Listener] Socket Error: {e}")
-                else:
-                    self._log("[UDP Listener] Socket closed, shutting down.")
-                    break
-            except Exception as e:
-                self._log(f"[UDP Listener] Unexpected error: {e}")
-                time.sleep(1)
+        # Everything drained in one wake-up is queued as one batch sharing a single timestamp
+        if not self.db.record_locations(parsed):
+            self._log(f"[UDP Listener] Dropped {len(parsed)} location(s)")
 
-    def handle_client(self, conn, addr):
-        self._log(f'[{addr}] Client connected')
+    def _parse_udp_location(self, data: bytes, addr) -> tuple[str, float, float] | None:
+        if data[:1] == _OP_BEACON:
+            try:
+                vehicle_id, longitude, latitude = decode_beacon(data)
+            except FrameError as e:
+                self._log(f"[UDP {addr}] {e}")
+                return None
+        else:
+            match = _UDP_LOCATION_RE.match(data)
+            if not match:
+                self._log(f"[UDP {addr}] Invalid UDP message format: {data.decode(errors='replace').strip()}")
+                return None
+
+            vehicle_id = match.group(1).decode('ascii')
+            longitude = float(match.group(2))
+            latitude = float(match.group(3))
+        # Per-datagram path: skip building the message when INFO is off
+        if logger.isEnabledFor(logging.INFO):
+            self._log(f"[UDP {addr}] Buffered location for {vehicle_id}: ({longitude}, {latitude})")
+        return vehicle_id, longitude, latitude
+
+    def handle_client(self, client: _ClientConnection):
+        """Handle what one readable client socket has received; runs on a pool worker."""
+        conn, addr = client.conn, client.addr
+        view = _recv_buffer()
+        peer_closed = False
         try:
+            # Take everything the socket has queued before handling any of it
             while True:
-                data = conn.recv(1024)
-                if data:
-                    msg = data.decode().strip()
-                    self._log(f'[{addr}] {msg}')
-                    if not msg:
-                        continue
-                    self.handle_command(addr, conn, msg)
+                try:
+                    n = conn.recv_into(view)
+                except BlockingIOError:
+                    break
+                if not n:
+                    peer_closed = True
+                    break
+                client.buf += view[:n]
+                if n < RECV_BUFFER_SIZE:
+                    break  # a short read means it's drained; skip the recv() that would say so
+
+            # One read may carry several frames (or only part of one)
+            # Replies are queued on the connection and leave together in as few send() calls as fit
+            for frame in pop_frames(client.buf):
+                try:
+                    self.handle_frame(addr, client, frame)
+                except (FrameError, socket.error):
+                    raise
+                except Exception as e:
+                    # One bad frame must not cost the connection: a fleet shares it, and its
+                    # replies are matched to frames in order, so this one still gets an answer
+                    self._log(f'[{addr}] Unexpected error while handling frame: {e}')
+                    client.sendall(encode_frame(b"ERROR/Internal server error"))
+            client.flush()
+            if peer_closed:
+                self._close_client(client)
+                return
+        except FrameError as e:
+            self._log(f'[{addr}] Protocol error: {e}')
         except socket.error as e:
             self._log(f'[{addr}] Socket Error: {e}')
         except Exception as e:
             self._log(f'[{addr}] Unexpected error: {e}')
-        finally:
-            conn.close()
-            self._log(f'[{addr}] Client connection closed')
-
-    def handle_command(self, addr, sock_conn, args):
-        args = args.split('/')
-        if len(args) < 2:
-            self._log(f"[{addr}] Received invalid command: {args}")
-            sock_conn.sendall("ERROR/Invalid format, use `ID/COMMAND/*ARGS`".encode())
+        else:
+            # Hand the connection back to the selector thread to wait for more
+            self._rearm.append(client)
+            try:
+                self._wake_w.send(b"\0")
+            except BlockingIOError:
+                pass  # a wake-up is already pending
+            except OSError:
+                self._close_client(client)  # the server is shutting down
+            return
+        self._close_client(client)
+
+    def _close_client(self, client: _ClientConnection):
+        with self._clients_lock:
+            self._clients.discard(client)
+        client.conn.close()
+        self._log(f'[{client.addr}] Client connection closed')
+
+    def handle_frame(self, addr, sock_conn, frame: bytes):
+        """Answer one frame; every frame gets exactly one reply."""
+        if frame[:1] == _OP_UPDATE_LOCATION:
+            self.handle_location_frame(addr, sock_conn, frame)
+            return
+        frame = frame.strip()
+        if not frame:
+            # Still answered: the client may match replies to frames in order
+            sock_conn.sendall(encode_frame(b"ERROR/Empty command"))
+            return
+        # Per-frame path: skip decoding the frame for the log when INFO is off
+        if logger.isEnabledFor(logging.INFO):
+            self._log(f'[{addr}] {frame.decode(errors="replace")}')
+        self.handle_command(addr, sock_conn, frame)
+
+    def handle_location_frame(self, addr, sock_conn, frame: bytes):
+        try:
+            vid, session_id, latitude, longitude, status = decode_update_location(frame)
+        except FrameError as e:
+            self._log(f"[{addr}] {e}")
+            sock_conn.sendall(encode_frame(b"ERROR/Invalid UPDATE_LOCATION frame"))
+            return
+
+        try:
+            # Coordinates are already floats, which UpdateLocationCommand accepts as-is
+            UpdateLocationCommand(vid, sock_conn, self.db, [session_id, latitude, longitude, status]).execute()
+        except Exception as e:
+            self._log(f"[{addr}] Unexpected error while processing command: {e}")
+            sock_conn.sendall(encode_frame(b"ERROR/Internal server error"))
+
+    def handle_command(self, addr, sock_conn, data: bytes):
+        # Split on bytes first so only the fields we use are decoded
+        vid, sep, rest = data.partition(b'/')
+        if not sep:
+            self._log(f"[{addr}] Received invalid command: {data}")
+            sock_conn.sendall(encode_frame("ERROR/Invalid format, use `ID/COMMAND/*ARGS`".encode()))
             return
 
-        vid = args[0]
-        cmd_name = args[1].upper()
-        args = args[2:]
+        try:
+            vid = vid.decode("ascii")
+        except UnicodeDecodeError:
+            self._log(f"[{addr}] Received invalid vehicle ID: {vid!r}")
+            sock_conn.sendall(encode_frame(b"ERROR/Invalid vehicle ID"))
+            return
+        cmd_name, sep, args = rest.partition(b'/')
+        command = _resolve_command(cmd_name)
+        try:
+            args = args.decode().split('/') if sep else []
+        except UnicodeDecodeError:
+            self._log(f"[{addr}] Received invalid arguments: {args!r}")
+            sock_conn.sendall(encode_frame(b"ERROR/Invalid arguments"))
+            return
 
-        command = Command.COMMANDS.get(cmd_name)
         if not command:
+            cmd_name = cmd_name.decode(errors="replace").upper()
             self._log(f"[{addr}] Received invalid command: {cmd_name}")
-            sock_conn.sendall(f"ERROR/Invalid command: {cmd_name}".encode())
+            sock_conn.sendall(encode_frame(f"ERROR/Invalid command: {cmd_name}".encode()))
             return
 
         try:
             cmd_instance = command(vid, sock_conn, self.db, args)
-            self._log(f"[{addr}] Executed command: {cmd_name}")
+            if logger.isEnabledFor(logging.INFO):
+                self._log(f"[{addr}] Executed command: {command.COMMAND_NAME}")
             cmd_instance.execute()
         except Exception as e:
             self._log(f"[{addr}] Unexpected error while processing command: {e}")
+            sock_conn.sendall(encode_frame(b"ERROR/Internal server error"))
+
+@functools.lru_cache(maxsize=64)
+def _resolve_command(raw_name: bytes) -> type['Command'] | None:
+    """Map the raw command field of a frame to its Command class, caching the decode/upper per name."""
+    try:
+        return Command.COMMANDS.get(raw_name.decode().upper())
+    except UnicodeDecodeError:
+        return None
 
 class Command(ABC):
     COMMANDS: dict[str, type['Command']] = {}
@@ -232,16 +727,21 @@ class Command(ABC):
         self.sock_conn = sock_conn
         self.db = db
         self.args = args
+        self.responded = False  # every frame gets exactly one reply; clients pair them up in order
 
     def _log(self, *args):
-        msg = " ".join(map(str, args))
-        print(f'[{self.vid}/{self.__class__.__name__}] | {msg}')
+        # Pieces are joined only when INFO is on, so per-frame calls pass them unformatted
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('[%s/%s] | %s', self.vid, self.__class__.__name__, " ".join(map(str, args)))
 
-    def send_response(self, *args: str):
-        message = "/".join(args)
+    def send_response(self, *args: bytes):
+        # Replies are bytes from the start, so the common constant ones are framed without an encode
+        message = b"/".join(args)
         try:
-            self.sock_conn.sendall(message.encode())
-            self._log(f'Responded with: {message}')
+            self.responded = True
+            self.sock_conn.sendall(encode_frame(message))
+            if logger.isEnabledFor(logging.INFO):
+                self._log('Responded with:', message.decode(errors="replace"))
         except socket.error as e:
             self._log(f"Error sending response: {e}")
 
@@ -261,16 +761,18 @@ class Command(ABC):
         return True
 
     def execute(self):
-        self._log(f"Command sent with args: {self.args}")
+        self._log("Command sent with args:", self.args)
 
         if not self._validate_args():
+            if not self.responded:
+                self.send_response(b"ERROR/Invalid arguments")
             return
 
         try:
             self._execute()
         except Exception as e:
             self._log(f"Unexpected error during execution: {e}")
-            self.send_response(f"ERROR:Internal server error")
+            self.send_response(b"ERROR:Internal server error")
 
     @abstractmethod
     def _execute(self):
@@ -280,11 +782,11 @@ class Command(ABC):
         super().__init_subclass__(**kwargs)
 
         if cls.COMMAND_NAME is None:
-            print(f"Skipping command registration for {cls.__name__} (no COMMAND_NAME)")
+            logger.info("Skipping command registration for %s (no COMMAND_NAME)", cls.__name__)
             return
 
         name = cls.COMMAND_NAME.upper()
-        print(f"Registering command: {name} -> {cls.__name__}")
+        logger.info("Registering command: %s -> %s", name, cls.__name__)
         Command.COMMANDS[name] = cls
 
 
@@ -302,36 +804,36 @@ class SessionCommand(Command):
 
         extracted_session_id = self.args[0]
 
-        self._log(f"Validating session ID: {extracted_session_id} for vehicle {self.vid}")
+        self._log("Validating session ID:", extracted_session_id, "for vehicle", self.vid)
         is_valid, validation_message = self.db.validate_session(extracted_session_id, self.vid)
 
         if not is_valid:
-            self._log(f"Session validation failed: {validation_message}")
-            self.send_response(f"ERROR/{validation_message}")
+            self._log("Session validation failed:", validation_message)
+            self.send_response(b"ERROR/" + validation_message.encode())
             return False
 
         self.session_id = extracted_session_id
         self._log("Session validation successful.")
 
-        self.args = self.args[1:]
-
+        # The session stays at args[0]; subclasses read their own arguments from index 1 on
+        provided = len(self.args) - 1
         expected = self.__class__.ARGS_EXPECTED
         min = self.__class__.ARGS_MIN
         if expected is not None:
-            if len(self.args) != expected:
-                err_msg = f"ERROR: {self.COMMAND_NAME} requires {expected} arguments after session ID, got {len(self.args)}."
+            if provided != expected:
+                err_msg = f"ERROR: {self.COMMAND_NAME} requires {expected} arguments after session ID, got {provided}."
                 self._log(err_msg)
-                self.send_response(err_msg)
+                self.send_response(err_msg.encode())
                 return False
-            self._log(f"Validated specific arg count ({expected}) for subclass.")
+            self._log("Validated specific arg count for subclass:", expected)
 
         if min is not None:
-            if len(self.args) < min:
-                err_msg = f"ERROR: {self.COMMAND_NAME} requires at least {min} arguments after session ID, got {len(self.args)}."
+            if provided < min:
+                err_msg = f"ERROR: {self.COMMAND_NAME} requires at least {min} arguments after session ID, got {provided}."
                 self._log(err_msg)
-                self.send_response(err_msg)
+                self.send_response(err_msg.encode())
                 return False
-            self._log(f"Validated minimum arg count ({min}) for subclass.")
+            self._log("Validated minimum arg count for subclass:", min)
 
         return True
 
@@ -339,22 +841,26 @@ class RegisterCommand(Command):
     COMMAND_NAME = "REGISTER"
 
     def _execute(self):
-        vehicle_type = VehicleType(self.vid[0])
-
-        self._log(f'Checking DB for vehicle {self.vid}')
-        if self.db.vehicle_exists(self.vid):
-            self._log(f'Vehicle {self.vid} already registered.')
-            self.send_response("EXISTS")
+        vehicle_type = PREFIX_MAP.get(self.vid[:1])
+        if vehicle_type is None:
+            self._log(f'Unknown vehicle type prefix in {self.vid}')
+            self.send_response(b"ERROR/Unknown vehicle type")
             return
 
         self._log(f'Registering vehicle {self.vid}...')
-        if self.db.register_vehicle(self.vid, vehicle_type.value):
+        # REGISTER/<password> protects the vehicle's future logins; it's optional
+        password = self.args[0] if self.args else None
+        result = self.db.register_vehicle(self.vid, vehicle_type.value, password)
+        if result == "REGISTERED":
             self._log(f'Vehicle registration successful: {self.vid}')
             session = self.db.create_session(self.vid)
-            self.send_response(self.vid, session)
+            self.send_response(self.vid.encode(), session.encode())
+        elif result == "EXISTS":
+            self._log(f'Vehicle {self.vid} already registered.')
+            self.send_response(b"EXISTS")
         else:
             self._log(f'Vehicle registration failed for: {self.vid}')
-            self.send_response("ERROR/Registration failed")
+            self.send_response(b"ERROR/Registration failed")
 
 class LoginCommand(Command):
     COMMAND_NAME = "LOGIN"
@@ -364,13 +870,43 @@ class LoginCommand(Command):
         self._log(f'Checking DB for vehicle {self.vid}')
         if not self.db.vehicle_exists(self.vid):
             self._log(f'Vehicle {self.vid} is not registered.')
-            self.send_response("UNREGISTERED/Please register your vehicle")
+            self.send_response(b"UNREGISTERED/Please register your vehicle")
+            return
+
+        password = self.args[0] if self.args else None
+        if not self.db.password_correct(self.vid, password):
+            self._log(f'Wrong password for vehicle {self.vid}')
+            self.send_response(b"INVALID/Wrong password")
             return
 
         self._log(f'Login successful')
         session = self.db.create_session(self.vid)
-        self.send_response(self.vid, session)
-        
+        self.send_response(self.vid.encode(), session.encode())
+
+class UpdateLocationCommand(SessionCommand):
+    COMMAND_NAME = "UPDATE_LOCATION"
+    ARGS_MIN = 2  # Minimum args: lat, lon
+
+    def _execute(self):
+        # Vehicles send UPDATE_LOCATION/<session>/<lat>/<lon>[/<status>]
+        try:
+            latitude = float(self.args[1])
+            longitude = float(self.args[2])
+        except ValueError:
+            self._log("Invalid location format:", self.args[1:])
+            self.send_response(b"ERROR/Invalid location format. Latitude/Longitude must be numbers.")
+            return
+
+        status = self.args[3] if len(self.args) > 3 else None
+
+        self._log("Updating location for", self.vid, (latitude, longitude), "Status:", status)
+
+        if self.db.record_location(self.vid, longitude, latitude):
+            self.db.update_vehicle_state(self.vid, latitude, longitude, status)
+            self.send_response(b"OK/Location Updated")
+        else:
+            self.send_response(b"ERROR/Failed to update location in database")
+
 if __name__ == '__main__':
     addr = 'localhost'
     TCP_SERVER_PORT = 8000
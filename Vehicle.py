@@ -1,11 +1,22 @@
-from places import get_place_by_id, try_enter_place, remove_vehicle_from_place, is_place_full
-from Database import get_db_session, Routes
+from places import get_places_by_ids, try_enter_place, remove_vehicle_from_place, wait_for_departure, vehicle_grid
+from Database import ReadSession, Routes
+from beacons import get_dispatcher, get_scheduler
+from mux import TransitClientMux
+from logs import get_logger
+from protocol import FRAME_HEADER, FrameError, encode_frame, pop_frames, update_location_prefix, beacon_prefix, pack_beacon_into, BEACON_BODY, LOCATION_BODY, STATE_CODES
+from sqlalchemy import bindparam, select
+from collections import deque
+from functools import partial
 from typing import Tuple, Dict
 from enum import Enum
+from math import hypot
 import threading
+import selectors
+import asyncio
 import socket
-import random
+from random import random
 import time
+import sys
 
 class VehicleType(Enum):
     TRAIN = "T"
@@ -13,45 +24,111 @@ class VehicleType(Enum):
     UBER = "U"
     SHUTTLE = "S"
 
+# Vehicle IDs start with their type's letter, e.g. "B101" is a bus
+PREFIX_MAP: Dict[str, VehicleType] = {
+    "B": VehicleType.BUS,
+    "U": VehicleType.UBER,
+    "S": VehicleType.SHUTTLE,
+    "T": VehicleType.TRAIN,
+}
+VTYPE_PREFIX: Dict[VehicleType, str] = {vtype: prefix for prefix, vtype in PREFIX_MAP.items()}
+
+# A vehicle's stops in order; built once so loading a route skips the ORM Query machinery,
+# and only the place IDs are selected so no Routes objects are created
+ROUTE_STEPS = (
+    select(Routes.place_id)
+    .where(Routes.vehicle_id == bindparam("vehicle_id"))
+    .order_by(Routes.step_index)
+)
+
+QUICKACK = getattr(socket, "TCP_QUICKACK", None)  # Linux only
+
+# Formatted and written by the shared log listener thread, not the thread that logs
+logger = get_logger("vehicle")
+
 
 class Vehicle:
+    # Fixed attribute layout: no per-instance __dict__, which adds up when a process runs a whole fleet
+    __slots__ = (
+        "is_running", "id", "password", "session", "type", "client",
+        "server_tcp_addr", "server_udp_addr", "tcp_client",
+        "beacon_interval",
+        "route", "current_index", "state", "lat", "lon", "delayed",
+        "_id_prefix", "_beacon_buf", "_beacon_body_offset", "_rx_buf", "_rx_view", "_rx_pending", "_rx_frames", "_prompt_shown",
+        "_beacons_scheduled", "_places", "_dlat", "_dlon", "_steps_left", "_wait",
+        "_send_buf", "_status_prefix", "_status_session", "_last_update", "_cmd_templates", "_mux",
+    )
     COMMANDS: Dict[str, bool] = {
         "REGISTER": False,
         "LOGIN": False,
+        "UPDATE_LOCATION": True,
     }
-    def __init__(self, id: str, type: VehicleType, addr: str, tcp_port: int, udp_port: int, password: str = None, session: str = None) -> None:
+    SOCKET_BUFFER_SIZE = 64 * 1024  # bytes; frames are tiny, and a fleet of separate sockets adds up
+    STEP_SIZE = 0.0005  # degrees moved per MOVING tick
+    MAX_LEG_STEPS = 100  # cap for very long legs, e.g. the first one from (0, 0)
+    BEACON_JITTER_SPAN = 0.0002  # degrees; beacons are off by up to half of this on each axis
+
+    def __init__(self, id: str, type: VehicleType, addr: str, tcp_port: int, udp_port: int, password: str = None, session: str = None, mux: TransitClientMux | None = None) -> None:
         self.is_running = False
         self.id = id
         self.password = password
         self.session = session
         self.type = type
-        if self.id[0]!=type.value:
+        if self.id[0]!=VTYPE_PREFIX[type]:
             raise ValueError(f"Vehicle ID must correlate with vehicle type!\nID = {self.id}\nType = {self.type.value}")
+        self._id_prefix = f"{self.id}/".encode()  # Every frame this vehicle sends starts with it
+        # The beacon datagram's layout is fixed: the ID part is written once, the coordinates in place per send
+        prefix = beacon_prefix(self.id)
+        self._beacon_buf = bytearray(prefix) + bytearray(BEACON_BODY.size)
+        self._beacon_body_offset = len(prefix)
         self.client = None
+        # Reused receive buffer so each response doesn't allocate a fresh recv() bytes object
+        self._rx_buf = bytearray(4096)
+        self._rx_view = memoryview(self._rx_buf)
+        self._rx_pending = bytearray()  # Bytes of a response frame that hasn't fully arrived
+        self._rx_frames = deque()  # Complete response frames not yet returned by receive()
+        self._prompt_shown = False
+        self._beacons_scheduled = False  # registered with the shared beacon scheduler
 
         self.server_tcp_addr = (addr, tcp_port)
         self.server_udp_addr = (addr, udp_port)
 
         self.tcp_client: socket.socket | None = None
-        self.udp_client: socket.socket | None = None
-        self.beacon_thread: threading.Thread | None = None
         self.beacon_interval: int = 10
 
-        self.connect(self.server_tcp_addr)
+        # Fleet vehicles may share one connection instead of opening their own
+        self._mux = mux
+        if mux is None:
+            self.connect(self.server_tcp_addr)
         
         self.route = []  # List of place IDs in the route
+        self._places = []  # Place rows for self.route, same order
         self.current_index = 0  # Current step in the route
         self.state = "IDLE"  # IDLE, MOVING, WAITING, DELAYED, FINISHED
         self.lat = 0.0  # Current latitude
         self.lon = 0.0  # Current longitude
         self.delayed = False  # Whether the vehicle is delayed
+        self._dlat = 0.0  # Per-tick movement for the current leg, set by _start_leg()
+        self._dlon = 0.0
+        self._steps_left = 0
+        self._wait = None  # Blocking wait(timeout) for the next pause, if something can end it early
+        self._send_buf = bytearray()  # Status frames waiting for the next _flush()
+        self._status_prefix = b""  # Frame header + binary UPDATE_LOCATION header for self._status_session
+        self._status_session = None
+        self._last_update = None  # Packed LOCATION_BODY of the last status sent
+        self._cmd_templates = (None, {})  # (session, payload prefix per command) for the command line
 
     def _log(self, msg: str) -> None:
-        print(self.id + " | " + msg)
+        logger.info("%s | %s", self.id, msg)
 
     def connect(self, address):
         try:
             self.tcp_client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # Commands are tiny request/response frames; don't let Nagle hold them back
+            self.tcp_client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.tcp_client.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.SOCKET_BUFFER_SIZE)
+            self.tcp_client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.SOCKET_BUFFER_SIZE)
+            self._quickack()
             self.tcp_client.connect(address)
             self._log("TCP Connection established!")
         except socket.error as e:
@@ -59,21 +136,23 @@ class Vehicle:
             self.tcp_client = None
             return
 
-        try:
-            self.udp_client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self._log("UDP socket created.")
-        except socket.error as e:
-            self._log(f"UDP socket creation failed: {e}")
-            self.udp_client = None
+    def _quickack(self) -> None:
+        # Linux only; ACK replies immediately instead of waiting to piggyback them.
+        # The kernel drops back to delayed ACKs on its own, so this is re-armed after reads.
+        if QUICKACK is not None:
+            try:
+                self.tcp_client.setsockopt(socket.IPPROTO_TCP, QUICKACK, 1)
+            except OSError:
+                pass
 
     def send(self, command_payload: str) -> bool:
         if not self.tcp_client:
             self._log("Cannot send TCP: Not connected.")
             return False
-        msg = f"{self.id}/{command_payload}"
+        msg = self._id_prefix + command_payload.encode()
         try:
-            self._log(f"Sending TCP: {msg}")
-            self.tcp_client.sendall(msg.encode())
+            self._log(f"Sending TCP: {self.id}/{command_payload}")
+            self.tcp_client.sendall(encode_frame(msg))
             return True
         except socket.error as e:
             self._log(f"Error sending TCP message: {e}")
@@ -84,37 +163,45 @@ class Vehicle:
             self._handle_disconnect()
             return False
 
-    def send_udp_beacon(self) -> None:
-        if not self.udp_client or not self.is_running:
-            return
-        self.current_latitude += random.uniform(-0.0001, 0.0001)
-        self.current_longitude += random.uniform(-0.0001, 0.0001)
+    def beacon(self) -> tuple[bytes, tuple[str, int]] | None:
+        """The next (datagram, address) to beacon, or None while the vehicle isn't running."""
+        if not self.is_running:
+            return None
+        # Report the current position with a little GPS-style jitter
+        # (random() - 0.5) * span is uniform(-JITTER, JITTER) without the Python-level uniform() call
+        latitude = self.lat + (random() - 0.5) * self.BEACON_JITTER_SPAN
+        longitude = self.lon + (random() - 0.5) * self.BEACON_JITTER_SPAN
 
-        message = f"{self.id}/{self.current_longitude:.6f}/{self.current_latitude:.6f}"
         try:
-            self.udp_client.sendto(message.encode(), self.server_udp_addr)
-        except socket.error as e:
-            self._log(f"Error sending UDP beacon: {e}")
-        except Exception as e:
-            self._log(f"Unexpected error sending UDP beacon: {e}")
+            pack_beacon_into(self._beacon_buf, self._beacon_body_offset, longitude, latitude)
+        except FrameError as e:
+            self._log(f"Skipping beacon: {e}")
+            return None
+        # One immutable copy: the dispatcher thread sends it later, after this buffer is reused
+        return bytes(self._beacon_buf), self.server_udp_addr
 
-    def _beacon_loop(self) -> None:
-        self._log(f"Starting UDP beacon loop (interval: {self.beacon_interval}s)")
-        while self.is_running:
-            self.send_udp_beacon()
-            time.sleep(self.beacon_interval)
-        self._log("UDP beacon loop stopped.")
+    def send_udp_beacon(self) -> None:
+        beacon = self.beacon()
+        if beacon is not None:
+            # Sent by the shared dispatcher thread, batched with other vehicles' beacons
+            get_dispatcher().submit(*beacon)
 
     def receive(self) -> str:
         if not self.tcp_client:
             self._log("Cannot receive TCP: Not connected.")
             return ""
         try:
-            data = self.tcp_client.recv(1024).decode()
-            if not data:
-                self._log("Receive TCP failed: Connection closed by server.")
-                self._handle_disconnect()
-                return ""
+            # Read until at least one whole frame is buffered; extra frames wait for the next call
+            while not self._rx_frames:
+                n = self.tcp_client.recv_into(self._rx_view)
+                if not n:
+                    self._log("Receive TCP failed: Connection closed by server.")
+                    self._handle_disconnect()
+                    return ""
+                self._quickack()
+                self._rx_pending += self._rx_view[:n]
+                self._rx_frames.extend(pop_frames(self._rx_pending))
+            data = self._rx_frames.popleft().decode()
             self._log(f"Received TCP: {data}")
             return data
         except socket.timeout:
@@ -144,9 +231,11 @@ class Vehicle:
         self._log("Initiating manual close...")
         self.is_running = False
 
-        if self.beacon_thread and self.beacon_thread.is_alive():
-            self._log("Waiting for beacon thread...")
-            self.beacon_thread.join(timeout=1.0)
+        # Only touch the scheduler if this vehicle used it; get_scheduler() would start its thread
+        if self._beacons_scheduled:
+            get_scheduler().unregister(self)
+            self._beacons_scheduled = False
+        vehicle_grid.remove(self.id)
 
         if self.tcp_client:
             try:
@@ -156,15 +245,6 @@ class Vehicle:
                 self._log(f"Error closing TCP connection: {e}")
             finally:
                  self.tcp_client = None
-
-        if self.udp_client:
-            try:
-                self.udp_client.close()
-                self._log("UDP socket closed")
-            except socket.error as e:
-                self._log(f"Error closing UDP socket: {e}")
-            finally:
-                 self.client = None
                  
     def run(self) -> None:
         if not self.tcp_client:
@@ -188,110 +268,115 @@ class Vehicle:
 
         self.is_running = True
 
-        if self.udp_client:
-            self.beacon_thread = threading.Thread(target=self._beacon_loop, daemon=True)
-            self.beacon_thread.start()
-        else:
-            self._log("UDP beacon thread not started (UDP client not available).")
+        self._log(f"Starting UDP beacons (interval: {self.beacon_interval}s)")
+        self.open(beacons=True)
 
-        self.open()
+    def _auth_command(self, command_name: str) -> str:
+        return f"{command_name}/{self.password}" if self.password else command_name
 
     def register(self) -> None:
-        register_cmd = "REGISTER"
-        if self.password:
-            register_cmd += f"/{self.password}"
-
-        if not self.send(register_cmd): return
+        if not self.send(self._auth_command("REGISTER")): return
         self._log("Sent REGISTER command")
 
-        response = self.receive()
+        if self._on_register_response(self.receive()):
+            self.login()
+
+    def _on_register_response(self, response: str) -> bool:
+        """Apply the server's reply to REGISTER; returns True if the vehicle should log in instead."""
         if not response:
             self._log("Registration failed: No response received")
-            return
+            return False
 
-        parts = response.split('/')
-        status = parts[0]
+        status, sep, detail = response.partition('/')
 
         if status == "EXISTS":
             self._log("Vehicle exists, attempting login...")
-            self.login()
-        elif status == self.id and len(parts) > 1:
-            self.session = parts[1]
+            return True
+        elif status == self.id and sep:
+            self.session = detail
             self._log("Registration successful!")
             self._log(f"Using session {self.session}")
         else:
             self._log(f"Registration failed or unexpected response: {response}")
-            if status == "ERROR" and len(parts) > 1:
-                self._log(f"Server error message: {parts[1]}")
+            if status == "ERROR" and sep:
+                self._log(f"Server error message: {detail}")
+        return False
 
     def login(self) -> None:
-        if not self.password: self.password = ""
-        login_cmd = f"LOGIN"
-        if self.password:
-            login_cmd += f"/{self.password}"
-
-        if not self.send(login_cmd): return
+        if not self.send(self._auth_command("LOGIN")): return
+        self._on_login_response(self.receive())
 
-        response = self.receive()
+    def _on_login_response(self, response: str) -> None:
         if not response:
             self._log("Login failed: No response received")
             return
 
-        parts = response.split('/')
-        status = parts[0]
+        status, sep, detail = response.partition('/')
 
-        if status == self.id and len(parts) > 1:
-            self.session = parts[1]
+        if status == self.id and sep:
+            self.session = detail
             self._log("Login successful!")
             self._log(f"Using session {self.session}")
         else:
             if status == "UNREGISTERED" or status == "INVALID" or status == "ERROR":
-                error_message = parts[1] if len(parts) > 1 else "No details"
+                error_message = detail if sep else "No details"
                 self._log(f"Login failed: {status} - {error_message}")
             else:
                 self._log(f"Login failed: Unexpected response format '{response}'")
             self.session = None
 
-    def open(self):
+    def open(self, beacons: bool = False):
         self._log("Command line opened. Type commands or press Ctrl+C to exit.")
+        # Wait on stdin and the server socket together so shutdown and server pushes are
+        # noticed without a keypress; Windows can't select() on stdin, so it keeps input()
+        sel = None
+        next_beacon = None
+        if sys.platform != "win32":
+            sel = selectors.DefaultSelector()
+            sel.register(sys.stdin, selectors.EVENT_READ, "stdin")
+            sel.register(self.tcp_client, selectors.EVENT_READ, "server")
+            if beacons:
+                # The same wait also times the beacons, so they need no thread of their own
+                next_beacon = time.monotonic()
+        elif beacons:
+            # input() blocks, so the shared scheduler thread keeps time instead
+            get_scheduler().register(self, self.beacon_interval)
+            self._beacons_scheduled = True
         try:
             while self.is_running and self.tcp_client:
-                input_str = input(f"{self.id}> ").strip()
+                if sel is None:
+                    input_str = input(f"{self.id}> ").strip()
+                else:
+                    timeout = 0.5
+                    if next_beacon is not None:
+                        now = time.monotonic()
+                        if now >= next_beacon:
+                            self.send_udp_beacon()
+                            # Fixed rate, but don't try to catch up after a long stall
+                            next_beacon = max(next_beacon + self.beacon_interval, now)
+                        timeout = min(timeout, next_beacon - now)
+                    input_str = self._poll_command_line(sel, timeout)
+                    if input_str is None:
+                        continue
                 if not input_str:
                     continue
 
-                parts = input_str.split('/', 1)
-                command_name = parts[0].upper()
-                arguments_str = parts[1] if len(parts) > 1 else ""
-                requires_session = self.COMMANDS.get(command_name)
-
-                if command_name in ["REGISTER", "LOGIN"]:
-                    final_command_payload = input_str
-                    self._log(f"(Auth command) Preparing payload: {final_command_payload}")
-                elif requires_session is True:
-                    if not self.session:
-                        self._log(f"Error: Command '{command_name}' requires a session, but you are not logged in.")
-                        continue
-                    final_command_payload = f"{command_name}/{self.session}"
-                    if arguments_str:
-                        final_command_payload += f"/{arguments_str}"
-                    self._log(f"(Session required) Preparing payload: {final_command_payload}")
-                elif requires_session is False:
-                    final_command_payload = input_str
-                    self._log(f"(No session command) Preparing payload: {final_command_payload}")
-                else:
-                    self._log(f"Warning: Command '{command_name}' is not in the known list. Assuming session required.")
-                    if not self.session:
-                        self._log(f"Error: Command '{command_name}' requires a session, but you are not logged in.")
-                        continue
-                    final_command_payload = f"{command_name}/{self.session}"
-                    if arguments_str:
-                        final_command_payload += f"/{arguments_str}"
-                    self._log(f"(Unknown command - session assumed) Preparing payload: {final_command_payload}")
+                command_name, _, arguments_str = input_str.partition('/')
+                command_name = command_name.upper()  # commands are case-insensitive
+
+                format_payload = self._PAYLOAD_FORMATTERS.get(command_name, Vehicle._format_session_payload)
+                final_command_payload = format_payload(self, command_name, arguments_str, input_str)
+                if final_command_payload is None:
+                    continue
+                self._log(f"Preparing payload: {final_command_payload}")
 
                 if not self.send(final_command_payload):
                     break
 
+                if sel is not None:
+                    # The reply is logged when the socket becomes readable
+                    continue
+
                 response = self.receive()
                 if response:
                     pass
@@ -304,161 +389,458 @@ class Vehicle:
         except EOFError:
             self._log("Input stream closed, closing connection.")
         finally:
+            if sel is not None:
+                sel.close()
             self.close()
             self._log("Command line closed.")
+
+    def _format_typed_payload(self, command_name: str, arguments_str: str, input_str: str) -> str:
+        # Sent exactly as typed so the password goes along
+        return input_str
+
+    def _format_session_payload(self, command_name: str, arguments_str: str, input_str: str) -> str | None:
+        """Prefix the command with the session where it needs one; None if it can't be sent."""
+        requires_session = self.COMMANDS.get(command_name)
+        if requires_session is None:
+            self._log(f"Warning: Command '{command_name}' is not in the known list. Assuming session required.")
+        if requires_session is not False and not self.session:
+            self._log(f"Error: Command '{command_name}' requires a session, but you are not logged in.")
+            return None
+        payload = self._command_templates().get(command_name) or f"{command_name}/{self.session}"
+        return f"{payload}/{arguments_str}" if arguments_str else payload
+
+    # Typed commands that don't follow the session-prefixed form; everything else does
+    _PAYLOAD_FORMATTERS = {
+        "REGISTER": _format_typed_payload,
+        "LOGIN": _format_typed_payload,
+    }
+
+    def _command_templates(self) -> Dict[str, str]:
+        """Payload prefix for each known command, rebuilt only when the session changes."""
+        session, templates = self._cmd_templates
+        if session != self.session or not templates:
+            templates = {
+                name: f"{name}/{self.session}" if needs_session else name
+                for name, needs_session in self.COMMANDS.items()
+            }
+            self._cmd_templates = (self.session, templates)
+        return templates
+
+    def _poll_command_line(self, sel: selectors.BaseSelector, timeout: float) -> str | None:
+        """Wait up to `timeout` seconds for input; returns a typed line, or None if there was none."""
+        if not self._prompt_shown:
+            print(f"{self.id}> ", end="", flush=True)
+            self._prompt_shown = True
+
+        input_str = None
+        for key, _ in sel.select(timeout=max(0.0, timeout)):
+            if key.data == "server":
+                # Drain everything the server sent, including replies that arrived together
+                while self.receive() and self._rx_frames:
+                    pass
+                if not self.is_running:
+                    self._log("Connection lost during receive.")
+                    return None
+            else:
+                line = sys.stdin.readline()
+                if not line:
+                    raise EOFError
+                input_str = line.strip()
+                self._prompt_shown = False
+        return input_str
             
     def update_server_status(self):
+        vehicle_grid.update(self.id, self.lat, self.lon)
         if self.session:
-            payload = f"UPDATE_LOCATION/{self.session}/{self.lat:.6f}/{self.lon:.6f}/{self.state}"
-            self.send(payload)
-            
-    def is_position_occupied(self, lat: float, lon: float) -> bool:
-        session = get_db_session()
+            # Sent as a binary frame: only the packed coordinates and state change from tick to tick,
+            # and the frame length is fixed for a session, so the header is built once and reused
+            if self._status_session != self.session:
+                payload_prefix = update_location_prefix(self.id, self.session)
+                self._status_prefix = FRAME_HEADER.pack(len(payload_prefix) + LOCATION_BODY.size) + payload_prefix
+                self._status_session = self.session
+                self._last_update = None  # a new session always gets a first update
+
+            # Nothing to report if neither the position nor the state changed since the last update;
+            # the packed body doubles as the comparison key
+            body = LOCATION_BODY.pack(self.lat, self.lon, STATE_CODES[self.state])
+            if body == self._last_update:
+                return
+            self._last_update = body
+            self._send_buf += self._status_prefix
+            self._send_buf += body
+
+    def _flush(self) -> bool:
+        """Send every queued frame in a single sendall()."""
+        if not self._send_buf:
+            return True
+        if not self.tcp_client:
+            self._log("Cannot send TCP: Not connected.")
+            self._send_buf.clear()
+            return False
         try:
-            count = session.query(Vehicle).filter(
-                Vehicle.vehicle_id != self.id,
-                abs(Vehicle.latitude - lat) < 0.0001,
-                abs(Vehicle.longitude - lon) < 0.0001
-            ).count()
-            return count > 0
+            self.tcp_client.sendall(self._send_buf)
+            return True
+        except socket.error as e:
+            self._log(f"Error sending TCP message: {e}")
+            self._handle_disconnect()
+            return False
         finally:
-            session.close()
+            self._send_buf.clear()
+
+    def _pause(self, seconds: float) -> None:
+        # Anything queued so far should reach the server before the vehicle goes quiet
+        self._flush()
+        wait, self._wait = self._wait, None
+        (wait or time.sleep)(seconds)
+            
+    def is_position_occupied(self, lat: float, lon: float) -> bool:
+        # Answered from the in-memory grid of this process's vehicles, no database round trip
+        return vehicle_grid.occupied(self.id, lat, lon)
             
     def load_route_from_db(self) -> None:
         """Load the route for this vehicle from the database."""
-        session = get_db_session()
-        route_steps = (
-            session.query(Routes)
-            .filter_by(vehicle_id=self.id)
-            .order_by(Routes.step_index)
-            .all()
-        )
-        self.route = [step.place_id for step in route_steps]
+        # Short-lived, so a fleet doesn't keep one pooled connection checked out per vehicle
+        with ReadSession() as session:
+            self.route = session.execute(ROUTE_STEPS, {"vehicle_id": self.id}).scalars().all()
+        # Places don't change during a route, so resolve them all here in one query instead of every tick
+        places = get_places_by_ids(self.route)
+        self._places = [places.get(place_id) for place_id in self.route]
         self._log(f"Loaded route: {self.route}")
 
+    def _start_leg(self, place) -> None:
+        """Split the trip to `place` into equal steps of about STEP_SIZE degrees."""
+        dlat = place.latitude - self.lat
+        dlon = place.longitude - self.lon
+        dist = hypot(dlat, dlon)
+        steps = min(self.MAX_LEG_STEPS, max(1, int(dist / self.STEP_SIZE)))
+        self._dlat = dlat / steps
+        self._dlon = dlon / steps
+        self._steps_left = steps
+
     def run_route_loop(self) -> None:
         """Continuously move along the route."""
         self._log("Starting run_route_loop()")
         while self.is_running:
-            if self.state == "IDLE" and self.route:
-                next_place_id = self.route[self.current_index]
-                next_place = get_place_by_id(next_place_id)
-                if not next_place:
-                    self._log(f"Error: Place {next_place_id} not found.")
-                    self.state = "IDLE"
-                    continue
+            delay = self._tick()
+            if delay is None:
+                break
+            self._pause(delay)
+
+        # Don't lose the FINISHED status queued right before leaving the loop
+        self._flush()
+
+    async def run_route_async(self) -> None:
+        """Coroutine version of run_route_loop; many vehicles can share one event loop."""
+        self._log("Starting run_route_async()")
+        loop = asyncio.get_running_loop()
+        while self.is_running:
+            if not self.session:
+                # A status update was refused for an expired or invalid session
+                self._on_login_response(await self._request_async(loop, self._auth_command("LOGIN")))
+                if not self.session:
+                    break
+                self.update_server_status()  # announce where the vehicle is under the new session
+            delay = self._tick()
+            # A blocking condition wait would stall every vehicle on the loop, so just sleep
+            self._wait = None
+            await self._flush_async(loop)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+
+    async def run_async(self) -> None:
+        """Register, load the route and drive it on the running event loop (no command line)."""
+        if not self.tcp_client and self._mux is None:
+            self._log("Cannot run: Not connected.")
+            return
 
-                # Preemptive check for place capacity
-                if not next_place.pass_through and is_place_full(next_place_id):
-                    self._log(f"{next_place_id} is full. Waiting before approaching.")
-                    self.state = "DELAYED"
-                    self.update_server_status()
-                    time.sleep(1)
-                    continue
+        loop = asyncio.get_running_loop()
+        if self.tcp_client:
+            self.tcp_client.setblocking(False)
+        await self.register_async(loop)
+        if not self.session:
+            self._log("Startup failed: Could not establish session.")
+            self.close()
+            return
 
-                self._log(f"Moving to {next_place_id} ({next_place.latitude}, {next_place.longitude})")
-                self.state = "MOVING"
-                self.update_server_status()
+        await asyncio.to_thread(self.load_route_from_db)
+        if not self.route:
+            self._log("No route found. Vehicle will remain idle.")
+            self.close()
+            return
 
-            elif self.state == "MOVING":
-                next_place_id = self.route[self.current_index]
-                next_place = get_place_by_id(next_place_id)
+        self.is_running = True
+        # Beacons are timed on the event loop too, so a fleet doesn't need the scheduler thread
+        beacons = asyncio.create_task(self._beacon_loop())
+        try:
+            await self.run_route_async()
+        finally:
+            beacons.cancel()
+            self.close()
 
-                if not next_place:
-                    self._log(f"Error: Place {next_place_id} not found.")
-                    self.state = "IDLE"
-                    continue
+    async def _beacon_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        # Fixed-rate deadlines on the loop's monotonic clock, so intervals don't drift
+        deadline = loop.time()
+        while self.is_running:
+            self.send_udp_beacon()
+            deadline += self.beacon_interval
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+    async def register_async(self, loop: asyncio.AbstractEventLoop) -> None:
+        """register() for a non-blocking socket, so a fleet's handshakes share the event loop."""
+        if self._on_register_response(await self._request_async(loop, self._auth_command("REGISTER"))):
+            self._on_login_response(await self._request_async(loop, self._auth_command("LOGIN")))
+
+    async def _request_async(self, loop: asyncio.AbstractEventLoop, command_payload: str) -> str:
+        """Send one command and wait for its reply, over the fleet's shared connection if there is one."""
+        if self._mux is None:
+            if not await self._send_async(loop, command_payload):
+                return ""
+            return await self._receive_async(loop)
+
+        self._log(f"Sending TCP: {self.id}/{command_payload}")
+        data = await self._mux.request(self._id_prefix + command_payload.encode())
+        if data:
+            self._log(f"Received TCP: {data}")
+        return data
+
+    async def _send_async(self, loop: asyncio.AbstractEventLoop, command_payload: str) -> bool:
+        if not self.tcp_client:
+            self._log("Cannot send TCP: Not connected.")
+            return False
+        try:
+            self._log(f"Sending TCP: {self.id}/{command_payload}")
+            await loop.sock_sendall(self.tcp_client, encode_frame(self._id_prefix + command_payload.encode()))
+            return True
+        except socket.error as e:
+            self._log(f"Error sending TCP message: {e}")
+            self._handle_disconnect()
+            return False
 
-                # Calculate the next step toward the target
-                new_lat = self.lat + (next_place.latitude - self.lat) * 0.1
-                new_lon = self.lon + (next_place.longitude - self.lon) * 0.1
+    async def _receive_async(self, loop: asyncio.AbstractEventLoop) -> str:
+        if not self.tcp_client:
+            self._log("Cannot receive TCP: Not connected.")
+            return ""
+        try:
+            while not self._rx_frames:
+                n = await loop.sock_recv_into(self.tcp_client, self._rx_view)
+                if not n:
+                    self._log("Receive TCP failed: Connection closed by server.")
+                    self._handle_disconnect()
+                    return ""
+                self._rx_pending += self._rx_view[:n]
+                self._rx_frames.extend(pop_frames(self._rx_pending))
+            data = self._rx_frames.popleft().decode()
+            self._log(f"Received TCP: {data}")
+            return data
+        except (socket.error, FrameError) as e:
+            self._log(f"Error receiving TCP message: {e}")
+            self._handle_disconnect()
+            return ""
+
+    async def _flush_async(self, loop: asyncio.AbstractEventLoop) -> None:
+        if not self._send_buf or not (self.tcp_client or self._mux):
+            self._send_buf.clear()
+            return
+        # Hand the buffer over instead of copying it; new frames go into a fresh one
+        buf, self._send_buf = self._send_buf, bytearray()
+        if self._mux is not None:
+            # The shared connection's reader discards the acknowledgements and hands back the errors
+            if not await self._mux.send_frames(buf, partial(self._on_status_error, self._status_session)):
+                self._log("Error sending TCP message: shared connection closed")
+                self.is_running = False
+            return
+        try:
+            await loop.sock_sendall(self.tcp_client, buf)
+        except socket.error as e:
+            self._log(f"Error sending TCP message: {e}")
+            self._handle_disconnect()
+
+    def _on_status_error(self, session: str, response: str) -> None:
+        """An UPDATE_LOCATION sent under `session` was refused; drop the session if that was why."""
+        self._log(f"Status update failed: {response}")
+        _, _, detail = response.partition('/')
+        # Replies to frames sent before a re-login must not drop the new session
+        if detail in ("SESSION_EXPIRED", "INVALID_SESSION") and self.session == session:
+            self.session = None
+
+    def _advance_route(self) -> bool:
+        """Move on to the next stop; returns True when the route is complete."""
+        self.current_index += 1
+        if self.current_index >= len(self.route):
+            self.state = "FINISHED"
+            self._log("Route complete. Vehicle finished.")
+            self.update_server_status()
+            return True
+        self.state = "IDLE"
+        self.update_server_status()
+        return False
+
+    def _tick(self) -> float | None:
+        """Advance the route by one step; returns seconds to wait before the next tick, or None once finished."""
+        if self.state == "IDLE" and self.route:
+            next_place_id = self.route[self.current_index]
+            next_place = self._places[self.current_index]
+            if not next_place:
+                self._log(f"Error: Place {next_place_id} not found.")
+                self.state = "IDLE"
+                return 0
+
+            self._log(f"Moving to {next_place_id} ({next_place.latitude}, {next_place.longitude})")
+            self._start_leg(next_place)
+            self.state = "MOVING"
+            self.update_server_status()
+
+        elif self.state == "MOVING" or (self.state == "DELAYED" and not self.delayed):
+            # DELAYED without a refused entry means blocked by traffic: retry the same step
+            next_place_id = self.route[self.current_index]
+            next_place = self._places[self.current_index]
+
+            if not next_place:
+                self._log(f"Error: Place {next_place_id} not found.")
+                self.state = "IDLE"
+                return 0
+
+            if self._steps_left > 0:
+                # Calculate the next step toward the target; the last one lands exactly on it
+                if self._steps_left == 1:
+                    new_lat, new_lon = next_place.latitude, next_place.longitude
+                else:
+                    new_lat = self.lat + self._dlat
+                    new_lon = self.lon + self._dlon
 
                 # Check for positional congestion
                 if self.is_position_occupied(new_lat, new_lon):
-                    self._log(f"Blocked by vehicle ahead at ({new_lat:.6f}, {new_lon:.6f}). Waiting...")
-                    self.state = "DELAYED"
-                    self.update_server_status()
-                    time.sleep(1)
-                    continue
+                    if self.state != "DELAYED":
+                        self._log(f"Blocked by vehicle ahead at ({new_lat:.6f}, {new_lon:.6f}). Waiting...")
+                        self.state = "DELAYED"
+                        self.update_server_status()
+                    # Re-check as soon as any vehicle moves, with a 5s cap
+                    self._wait = vehicle_grid.wait_for_change
+                    return 5
 
                 # Update position
+                self.state = "MOVING"
                 self.lat = new_lat
                 self.lon = new_lon
+                self._steps_left -= 1
                 self._log(f"Current location: ({self.lat:.6f}, {self.lon:.6f})")
                 self.update_server_status()
 
-                # Distance-based arrival detection
-                def euclidean_dist(lat1, lon1, lat2, lon2):
-                    return ((lat1 - lat2)**2 + (lon1 - lon2)**2) ** 0.5
-
-                if euclidean_dist(self.lat, self.lon, next_place.latitude, next_place.longitude) < 0.00005:
-                    self._log(f"Arrived at {next_place_id}")
-                    success, status = try_enter_place(self.id, next_place_id)
-                    if success:
-                        self._log(f"Entered {next_place_id}: {status}")
-
-                        if next_place.pass_through:
-                            self._log(f"{next_place_id} is a pass-through. Skipping wait.")
-                            remove_vehicle_from_place(self.id)
-                            self.current_index += 1
-                            if self.current_index >= len(self.route):
-                                self.state = "FINISHED"
-                                self._log("Route complete. Vehicle finished.")
-                                self.update_server_status()
-                                break
-                            else:
-                                self.state = "IDLE"
-                                self.update_server_status()
-                        else:
-                            self.state = "WAITING"
-                            self.update_server_status()
-                            time.sleep(next_place.stay_time_seconds or 60)
-                            remove_vehicle_from_place(self.id)
-                            self._log(f"Leaving {next_place_id}")
-                            self.current_index += 1
-                            if self.current_index >= len(self.route):
-                                self.state = "FINISHED"
-                                self._log("Route complete. Vehicle finished.")
-                                self.update_server_status()
-                                break
-                            else:
-                                self.state = "IDLE"
-                                self.update_server_status()
+            # Arrival: every step of the leg has been taken
+            if self._steps_left == 0:
+                self._log(f"Arrived at {next_place_id}")
+                success, status = try_enter_place(self.id, next_place_id)
+                if success:
+                    self._log(f"Entered {next_place_id}: {status}")
+
+                    if next_place.pass_through:
+                        self._log(f"{next_place_id} is a pass-through. Skipping wait.")
+                        remove_vehicle_from_place(self.id)
+                        if self._advance_route():
+                            return None
                     else:
-                        self._log(f"Failed to enter {next_place_id}: {status}")
-                        self.delayed = True
-                        self.state = "DELAYED"
-                        self.update_server_status()
-                        time.sleep(5)
-                        self.delayed = False
-                        self.state = "MOVING"
+                        # Stay for the place's dwell time; the WAITING branch below leaves it
+                        self.state = "WAITING"
                         self.update_server_status()
+                        return next_place.stay_time_seconds or 60
+                else:
+                    self._log(f"Failed to enter {next_place_id}: {status}")
+                    self.delayed = True
+                    self.state = "DELAYED"
+                    self.update_server_status()
+                    # Retry after 5s, or sooner if someone leaves the place
+                    self._wait = partial(wait_for_departure, next_place_id)
+                    return 5
+
+        elif self.state == "WAITING":
+            next_place_id = self.route[self.current_index]
+            remove_vehicle_from_place(self.id)
+            self._log(f"Leaving {next_place_id}")
+            if self._advance_route():
+                return None
+
+        elif self.state == "DELAYED" and self.delayed:
+            # Retry entering the place after a refused entry
+            self.delayed = False
+            self.state = "MOVING"
+            self.update_server_status()
+
+        return 1
+
+
+class _TypedVehicle(Vehicle):
+    """A Vehicle whose type is fixed by its class, so callers don't pass one."""
+
+    __slots__ = ()
+    TYPE: VehicleType
+
+    def __init__(self, id: str, addr: str, tcp_port: int, udp_port: int, password: str = None, session: str = None, mux: TransitClientMux | None = None) -> None:
+        super().__init__(id, self.TYPE, addr, tcp_port, udp_port, password, session, mux)
+
+
+class TrainVehicle(_TypedVehicle):
+    __slots__ = ()
+    TYPE = VehicleType.TRAIN
+
+
+class BusVehicle(_TypedVehicle):
+    __slots__ = ()
+    TYPE = VehicleType.BUS
+
+
+class UberVehicle(_TypedVehicle):
+    __slots__ = ()
+    TYPE = VehicleType.UBER
+
+
+class ShuttleVehicle(_TypedVehicle):
+    __slots__ = ()
+    TYPE = VehicleType.SHUTTLE
+
+
+VEHICLE_CLASSES: Dict[str, type[_TypedVehicle]] = {
+    VTYPE_PREFIX[cls.TYPE]: cls for cls in (TrainVehicle, BusVehicle, UberVehicle, ShuttleVehicle)
+}
+
+def create_vehicle(vehicle_id: str, addr: str, tcp_port: int, udp_port: int, password: str = None, mux: TransitClientMux | None = None) -> Vehicle:
+    """Build the vehicle class matching the ID's type prefix; raises ValueError for an unknown prefix."""
+    cls = VEHICLE_CLASSES.get(vehicle_id[:1])
+    if cls is None:
+        raise ValueError(f"Unknown vehicle type for ID: {vehicle_id}")
+    return cls(vehicle_id, addr, tcp_port, udp_port, password, mux=mux)
+
+
+async def run_fleet(vehicles: list[Vehicle], stagger: float = 0.0) -> None:
+    """Drive several vehicles concurrently on one thread, starting each `stagger` seconds after the last."""
+    async def start(vehicle: Vehicle, delay: float) -> None:
+        if delay:
+            await asyncio.sleep(delay)
+        await vehicle.run_async()
+
+    await asyncio.gather(*(start(v, i * stagger) for i, v in enumerate(vehicles)))
 
-            time.sleep(1)
-            
 if __name__ == '__main__':
-    import sys
     if len(sys.argv) < 2:
-        print("Usage: python Vehicle.py <vehicle_id>")
+        print("Usage: python Vehicle.py <vehicle_id> [<vehicle_id> ...]")
         exit(1)
 
-    vehicle_id = sys.argv[1]
+    vehicle_ids = sys.argv[1:]
     SERVER_ADDRESS = "localhost"
     SERVER_TCP_PORT = 8000
     SERVER_UDP_PORT = 8001
-    
-    prefix_map = {
-        "B": VehicleType.BUS,
-        "U": VehicleType.UBER,
-        "S": VehicleType.SHUTTLE,
-        "T": VehicleType.TRAIN,
-    }
-
-    vtype = prefix_map.get(vehicle_id[0].upper())
-    if not vtype:
-        print(f"Unknown vehicle type for ID: {vehicle_id}")
-        exit(1)
-
-    v = Vehicle(vehicle_id, vtype, SERVER_ADDRESS, SERVER_TCP_PORT, SERVER_UDP_PORT)
-    v.run()
 
+    vehicles = []
+    for vehicle_id in vehicle_ids:
+        try:
+            vehicles.append(create_vehicle(vehicle_id, SERVER_ADDRESS, SERVER_TCP_PORT, SERVER_UDP_PORT))
+        except ValueError as e:
+            print(e)
+            exit(1)
+
+    if len(vehicles) == 1:
+        vehicles[0].run()
+    else:
+        # Several IDs: run them all as coroutines in this one process
+        asyncio.run(run_fleet(vehicles))
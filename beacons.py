@@ -0,0 +1,262 @@
+# beacons.py
+# Process-wide UDP beacon machinery. A single scheduler thread decides when each
+# vehicle beacons, and a single dispatcher thread sends everything queued so far.
+# Beacons sharing a destination go out as one UDP GSO send where the kernel supports
+# it, the rest with one sendmmsg(2) call on Linux, falling back to a sendto() loop elsewhere.
+
+import ctypes
+import ctypes.util
+import heapq
+import itertools
+import queue
+import socket
+import struct
+import sys
+import threading
+import time
+
+BEACON_BATCH_SIZE = 100  # max datagrams per sendmmsg() call
+GSO_MAX_SEGMENTS = 64  # the kernel's per-send segment limit on older releases
+UDP_SEGMENT = getattr(socket, "UDP_SEGMENT", 103)  # from linux/udp.h; not exported by every Python
+_GSO_SEG_SIZE = struct.Struct("=H")
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _msghdr), ("msg_len", ctypes.c_uint)]
+
+
+def _gso_supported(sock: socket.socket) -> bool:
+    """Probe UDP_SEGMENT with a one-segment send to a throwaway local socket."""
+    if not sys.platform.startswith("linux"):
+        return False
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        probe.bind(("127.0.0.1", 0))
+        sock.sendmsg([b"\0"], [(socket.SOL_UDP, UDP_SEGMENT, _GSO_SEG_SIZE.pack(1))], 0, probe.getsockname())
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+def _load_sendmmsg():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+
+class BeaconDispatcher:
+    def __init__(self):
+        self._q: queue.Queue = queue.Queue()
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sendmmsg = _load_sendmmsg()
+        self._gso = _gso_supported(self._sock)
+        self._sockaddrs: dict[tuple[str, int], ctypes.Array | None] = {}
+        if self._sendmmsg is not None:
+            # Header and iovec arrays are allocated once and refilled for every batch;
+            # each header permanently points at its own iovec
+            self._msgs = (_mmsghdr * BEACON_BATCH_SIZE)()
+            self._iovs = (_iovec * BEACON_BATCH_SIZE)()
+            for i in range(BEACON_BATCH_SIZE):
+                self._msgs[i].msg_hdr.msg_iov = ctypes.pointer(self._iovs[i])
+                self._msgs[i].msg_hdr.msg_iovlen = 1
+        self._thread = threading.Thread(target=self._run, daemon=True, name="beacon-dispatcher")
+        self._thread.start()
+
+    def submit(self, payload: bytes, addr: tuple[str, int]) -> None:
+        self._q.put([(payload, addr)])
+
+    def submit_many(self, beacons: list[tuple[bytes, tuple[str, int]]]) -> None:
+        """Queue several (payload, addr) pairs at once so they reach the same batch."""
+        if beacons:
+            self._q.put(beacons)
+
+    def _run(self):
+        while True:
+            pending = list(self._q.get())
+            while True:
+                try:
+                    pending.extend(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            if self._gso:
+                pending = self._send_gso(pending)
+            for i in range(0, len(pending), BEACON_BATCH_SIZE):
+                self._send(pending[i:i + BEACON_BATCH_SIZE])
+
+    def _send(self, batch: list[tuple[bytes, tuple[str, int]]]) -> None:
+        sent = self._send_batch(batch) if self._sendmmsg else 0
+        for payload, addr in batch[sent:]:
+            try:
+                self._sock.sendto(payload, addr)
+            except OSError:
+                # Beacons are best-effort; the next interval sends a fresh position anyway
+                pass
+
+    def _send_gso(self, batch: list[tuple[bytes, tuple[str, int]]]) -> list[tuple[bytes, tuple[str, int]]]:
+        """Send beacons that share a destination as one GSO buffer each; returns what's left to send.
+
+        GSO cuts the buffer into equal-sized segments, so shorter beacons are padded with spaces,
+        which the server's beacon parser ignores.
+        """
+        by_addr: dict[tuple[str, int], list[bytes]] = {}
+        for payload, addr in batch:
+            by_addr.setdefault(addr, []).append(payload)
+
+        rest = []
+        for addr, payloads in by_addr.items():
+            if len(payloads) < 2:
+                rest.append((payloads[0], addr))
+                continue
+            for i in range(0, len(payloads), GSO_MAX_SEGMENTS):
+                chunk = payloads[i:i + GSO_MAX_SEGMENTS]
+                seg_size = max(map(len, chunk))
+                try:
+                    self._sock.sendmsg(
+                        [b"".join(p.ljust(seg_size) for p in chunk)],
+                        [(socket.SOL_UDP, UDP_SEGMENT, _GSO_SEG_SIZE.pack(seg_size))],
+                        0,
+                        addr,
+                    )
+                except OSError:
+                    rest.extend((p, addr) for p in chunk)
+        return rest
+
+    def _sockaddr(self, addr: tuple[str, int]):
+        """Packed sockaddr_in for `addr`, resolved once; None if it isn't reachable over IPv4."""
+        if addr not in self._sockaddrs:
+            try:
+                ip = socket.gethostbyname(addr[0])
+                raw = struct.pack("=H", socket.AF_INET) + struct.pack("!H", addr[1]) + socket.inet_aton(ip) + bytes(8)
+                self._sockaddrs[addr] = ctypes.create_string_buffer(raw, len(raw))
+            except OSError:
+                self._sockaddrs[addr] = None
+        return self._sockaddrs[addr]
+
+    def _send_batch(self, batch: list[tuple[bytes, tuple[str, int]]]) -> int:
+        """Send the leading run of `batch` with sendmmsg(); returns how many datagrams went out."""
+        msgs, iovs = self._msgs, self._iovs
+        n = 0
+        for payload, addr in batch:
+            sockaddr = self._sockaddr(addr)
+            if sockaddr is None:
+                break
+            iovs[n].iov_base = ctypes.cast(ctypes.c_char_p(payload), ctypes.c_void_p)
+            iovs[n].iov_len = len(payload)
+            hdr = msgs[n].msg_hdr
+            hdr.msg_name = ctypes.cast(sockaddr, ctypes.c_void_p)
+            hdr.msg_namelen = ctypes.sizeof(sockaddr)
+            n += 1
+
+        sent = 0
+        while sent < n:
+            result = self._sendmmsg(self._sock.fileno(), ctypes.byref(msgs[sent]), n - sent, 0)
+            if result <= 0:
+                break  # the caller retries the rest with sendto()
+            sent += result
+        return sent
+
+
+_dispatcher: BeaconDispatcher | None = None
+_init_lock = threading.Lock()
+
+def get_dispatcher() -> BeaconDispatcher:
+    global _dispatcher
+    # Called for every beacon; only the first calls need the lock
+    if _dispatcher is not None:
+        return _dispatcher
+    with _init_lock:
+        if _dispatcher is None:
+            _dispatcher = BeaconDispatcher()
+        return _dispatcher
+
+
+class BeaconScheduler:
+    """One thread emits every registered vehicle's beacon, each on its own fixed-rate deadline.
+
+    Deadlines live in a heap; each wake-up collects every vehicle that is due and hands
+    their beacons to the dispatcher together, so they go out in the same batch.
+    """
+
+    def __init__(self):
+        self._wakeup = threading.Event()
+        self._heap: list[tuple[float, int, object, float, int]] = []  # (deadline, tiebreak, vehicle, interval, token)
+        self._registered: dict[object, int] = {}  # vehicle -> token of its current registration
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="beacon-scheduler")
+        self._thread.start()
+
+    def register(self, vehicle, interval: float) -> None:
+        """Beacon now and then every `interval` seconds until unregister()."""
+        with self._lock:
+            if vehicle in self._registered:
+                return
+            token = next(self._seq)
+            self._registered[vehicle] = token
+            heapq.heappush(self._heap, (time.monotonic(), token, vehicle, interval, token))
+        self._wakeup.set()
+
+    def unregister(self, vehicle) -> None:
+        # Its heap entry is dropped lazily when it comes due
+        with self._lock:
+            self._registered.pop(vehicle, None)
+
+    def _pop_due(self) -> tuple[list, float | None]:
+        """Pop and reschedule every due vehicle; returns them and the seconds until the next deadline."""
+        due = []
+        with self._lock:
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                deadline, _, vehicle, interval, token = heapq.heappop(self._heap)
+                if self._registered.get(vehicle) != token:
+                    continue  # unregistered (and maybe registered again) since this was scheduled
+                due.append(vehicle)
+                # Next deadline is computed from the last one, not from now, so intervals don't drift
+                heapq.heappush(self._heap, (deadline + interval, next(self._seq), vehicle, interval, token))
+            timeout = self._heap[0][0] - now if self._heap else None
+        return due, timeout
+
+    def _run(self):
+        dispatcher = get_dispatcher()
+        while True:
+            due, timeout = self._pop_due()
+            if due:
+                dispatcher.submit_many([b for b in (vehicle.beacon() for vehicle in due) if b is not None])
+            # Sleep until the next deadline; register() cuts it short when an earlier one shows up
+            if self._wakeup.wait(timeout):
+                self._wakeup.clear()
+
+
+_scheduler: BeaconScheduler | None = None
+
+def get_scheduler() -> BeaconScheduler:
+    global _scheduler
+    with _init_lock:
+        if _scheduler is None:
+            _scheduler = BeaconScheduler()
+        return _scheduler
@@ -1,19 +1,42 @@
+import queue
+import threading
 import tkinter as tk
 from tkinter import ttk
 from tkintermapview import TkinterMapView
+from sqlalchemy import bindparam, func, select
 from sqlalchemy.orm import Session
 from Database import Vehicle, Location, get_db_session
 from PIL import Image, ImageDraw, ImageTk
 
+# Newest row per vehicle among rows added after `last_id`, instead of a GROUP BY joined back to itself.
+# location_id, not timestamp: the writer stamps a row before it commits, so a row stamped earlier can
+# commit after a later-stamped batch was already read, while the rowid grows in commit order.
+# Built once so SQLAlchemy's compiled-statement cache serves every refresh.
+_ranked_locations = select(
+    Location.location_id,
+    Location.vehicle_id,
+    Location.latitude,
+    Location.longitude,
+    # Partitioned on vehicle_id || '' so SQLite doesn't walk all of ix_loc_vid_ts for the partition
+    # order, and searches only the rowid range past last_id instead
+    func.row_number().over(partition_by=Location.vehicle_id + "", order_by=Location.location_id.desc()).label("rn"),
+).where(Location.location_id > bindparam("last_id")).subquery()
+
+LATEST_LOCATIONS_AFTER = select(
+    _ranked_locations.c.location_id,
+    _ranked_locations.c.vehicle_id,
+    _ranked_locations.c.latitude,
+    _ranked_locations.c.longitude,
+).where(_ranked_locations.c.rn == 1)
+
+MARKER_POSITION_DECIMALS = 6  # ~0.1 m; smaller moves don't redraw a marker
+
 class TransitGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("Transit System Monitor")
         self.root.geometry("1000x600")
 
-        # Database Session
-        self.db_session: Session = get_db_session()
-
         # Main Frames
         self.main_frame = ttk.Frame(root, padding="10")
         self.main_frame.pack(fill=tk.BOTH, expand=True)
@@ -54,93 +77,121 @@ class TransitGUI:
         # Vehicle Markers
         self.dot_image = self.create_dot_icon(size=10, color="red")
         self.vehicle_markers = {}
+        self._last_vehicle_state: dict[str, str] = {}
+        self._latest_locations: dict[str, tuple[float, float]] = {}
+        self._last_marker_pos: dict[str, tuple[float, float]] = {}
+        self._last_location_id = 0
 
         self.refresh_interval_ms = 2000
-        self.update_data()
+        self.drain_interval_ms = 100
+        # Queries run on a worker thread so a slow database never stalls the Tk event loop. Tk may
+        # only be called from this thread, so the worker queues its results and they are picked up here.
+        self._results: queue.Queue = queue.Queue()
+        self._stop_polling = threading.Event()
+        self._poller = threading.Thread(target=self._poll_db, daemon=True, name="gui-db-poller")
+        self._poller.start()
+        self._drain_job = self.root.after(self.drain_interval_ms, self._drain_results)
 
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
-    def get_latest_locations(self) -> dict[str, tuple[float, float]]:
-        latest_locations = {}
+    def _poll_db(self):
+        db_session: Session = get_db_session()
+        try:
+            while not self._stop_polling.is_set():
+                try:
+                    vehicles = db_session.query(Vehicle.vehicle_id, Vehicle.status).all()
+                except Exception as e:
+                    print(f"Error fetching vehicles: {e}")
+                    db_session.rollback()
+                    vehicles = None
+                latest_locations = dict(self.get_latest_locations(db_session))
+                self._results.put((vehicles, latest_locations))
+                self._stop_polling.wait(self.refresh_interval_ms / 1000)
+        finally:
+            db_session.close()
+
+    def _drain_results(self):
+        """Apply the newest queued query results; runs on the Tk thread and re-arms itself."""
+        latest = None
         try:
-            subquery = self.db_session.query(
-                Location.vehicle_id,
-                func.max(Location.timestamp).label('max_timestamp')
-            ).group_by(Location.vehicle_id).subquery()
-
-            results = self.db_session.query(Location).join(
-                subquery,
-                (Location.vehicle_id == subquery.c.vehicle_id) &
-                (Location.timestamp == subquery.c.max_timestamp)
+            while True:
+                latest = self._results.get_nowait()  # each round is a full snapshot, so only the newest matters
+        except queue.Empty:
+            pass
+        if latest is not None:
+            self.update_data(*latest)
+        self._drain_job = self.root.after(self.drain_interval_ms, self._drain_results)
+
+    def get_latest_locations(self, db_session: Session) -> dict[str, tuple[float, float]]:
+        try:
+            # Only vehicles that reported since the last refresh
+            results = db_session.execute(
+                LATEST_LOCATIONS_AFTER, {"last_id": self._last_location_id}
             ).all()
-
-            for loc in results:
-                latest_locations[loc.vehicle_id] = (loc.latitude, loc.longitude)
+            for location_id, vehicle_id, latitude, longitude in results:
+                self._latest_locations[vehicle_id] = (latitude, longitude)
+                if location_id > self._last_location_id:
+                    self._last_location_id = location_id
         except Exception as e:
             print(f"Error fetching latest locations: {e}")
-            self.db_session.rollback()
-        return latest_locations
+            db_session.rollback()
+        return self._latest_locations
 
 
-    def update_data(self):
+    def update_data(self, vehicles, latest_locations: dict[str, tuple[float, float]]):
+        """Apply one round of query results to the list and map; runs on the Tk thread."""
         try:
-            vehicles = self.db_session.query(Vehicle).all()
-
-            selected_items = self.vehicle_list.selection()
-            scroll_pos = self.vehicle_list.yview()
-
-            for item in self.vehicle_list.get_children():
-                self.vehicle_list.delete(item)
-
-            for vehicle in vehicles:
-                self.vehicle_list.insert("", tk.END, values=(vehicle.vehicle_id, vehicle.status))
-
-            valid_selection = [item for item in selected_items if self.vehicle_list.exists(item)]
-            if valid_selection:
-                self.vehicle_list.selection_set(valid_selection)
-            self.vehicle_list.yview_moveto(scroll_pos[0])
-
-
-            latest_locations = self.get_latest_locations()
-
-            current_marker_ids = set(self.vehicle_markers.keys())
-            vehicles_with_location = set(latest_locations.keys())
-
-            first_marker_pos = None
+            if vehicles is None:
+                vehicles = list(self._last_vehicle_state.items())  # the vehicle query failed; keep the rows
+
+            # Rows are keyed by vehicle ID, so only changed rows are touched and the
+            # selection and scroll position survive on their own
+            seen = set()
+            for vehicle_id, status in vehicles:
+                seen.add(vehicle_id)
+                if vehicle_id not in self._last_vehicle_state:
+                    self.vehicle_list.insert("", tk.END, iid=vehicle_id, values=(vehicle_id, status))
+                elif self._last_vehicle_state[vehicle_id] != status:
+                    self.vehicle_list.item(vehicle_id, values=(vehicle_id, status))
+                self._last_vehicle_state[vehicle_id] = status
+
+            for vehicle_id in self._last_vehicle_state.keys() - seen:
+                self.vehicle_list.delete(vehicle_id)
+                del self._last_vehicle_state[vehicle_id]
+
+            # Markers are only touched when a vehicle moved by more than the rounding below,
+            # since every set_position/set_text makes the map redraw
+            new_markers = []
             for vehicle_id, (lat, lon) in latest_locations.items():
                 if lat is None or lon is None: continue
 
-                if first_marker_pos is None:
-                    first_marker_pos = (lat, lon)
+                pos = (round(lat, MARKER_POSITION_DECIMALS), round(lon, MARKER_POSITION_DECIMALS))
+                if self._last_marker_pos.get(vehicle_id) == pos:
+                    continue
+                self._last_marker_pos[vehicle_id] = pos
 
                 if vehicle_id in self.vehicle_markers:
-                    marker = self.vehicle_markers[vehicle_id]
-                    current_pos = marker.position
-                    if current_pos[0] != lat or current_pos[1] != lon:
-                        marker.set_position(lat, lon)
-                    marker.set_text(vehicle_id)
+                    self.vehicle_markers[vehicle_id].set_position(lat, lon)
                 else:
-                    new_marker = self.map_widget.set_marker(
-                        lat, lon,
-                        text=vehicle_id,
-                        icon=self.dot_image,
-                        icon_anchor="center"
-                    )
-                    self.vehicle_markers[vehicle_id] = new_marker
-
-            ids_to_remove = current_marker_ids - vehicles_with_location
-            for vehicle_id in ids_to_remove:
-                if vehicle_id in self.vehicle_markers:
-                    marker_to_remove = self.vehicle_markers[vehicle_id]
-                    marker_to_remove.delete()
-                    del self.vehicle_markers[vehicle_id]
+                    new_markers.append((vehicle_id, lat, lon))
+
+            for vehicle_id, lat, lon in new_markers:
+                self.vehicle_markers[vehicle_id] = self.map_widget.set_marker(
+                    lat, lon,
+                    text=vehicle_id,
+                    icon=self.dot_image,
+                    icon_anchor="center"
+                )
 
+            for vehicle_id in self.vehicle_markers.keys() - latest_locations.keys():
+                self.vehicle_markers.pop(vehicle_id).delete()
+                self._last_marker_pos.pop(vehicle_id, None)
+
+            self.map_widget.update_idletasks()
 
         except Exception as e:
             print(f"Error updating data: {e}")
 
-        self.root.after(self.refresh_interval_ms, self.update_data)
-
     def create_dot_icon(self, size: int, color: str) -> ImageTk.PhotoImage:
         image = Image.new("RGBA", (size, size), (0, 0, 0, 0))
         draw = ImageDraw.Draw(image)
@@ -151,15 +202,15 @@ class TransitGUI:
 
     def on_close(self):
         print("Closing GUI and database session...")
-        
-        if self.db_session:
-            self.db_session.close()
+
+        self._stop_polling.set()
+        self.root.after_cancel(self._drain_job)
+        # The poller never touches Tk, so the window can go even if a slow query keeps it running
+        self._poller.join(timeout=self.refresh_interval_ms / 1000)
         self.root.destroy()
 
 
 if __name__ == "__main__":
-    from sqlalchemy import func
-
     root = tk.Tk()
     app = TransitGUI(root)
     root.mainloop() 
\ No newline at end of file
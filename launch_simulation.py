@@ -1,7 +1,9 @@
-import subprocess
-import time
+import asyncio
 import random
+from sqlalchemy import delete, insert, select
 from Database import get_db_session, Vehicle as VehicleModel, Routes
+from Vehicle import create_vehicle, run_fleet
+from mux import TransitClientMux
 
 # Parameters
 NUM_VEHICLES = 5
@@ -10,6 +12,7 @@ VEHICLE_TYPES = ["B", "U", "S", "T"]
 
 session = get_db_session()
 vehicles = []
+routes = {}
 
 print("Generating vehicles and assigning routes...")
 for i in range(NUM_VEHICLES):
@@ -17,23 +20,36 @@ for i in range(NUM_VEHICLES):
     vid = f"{vtype}{100 + i}"
     vehicles.append(vid)
 
-    existing = session.query(VehicleModel).filter_by(vehicle_id=vid).first()
-    if not existing:
-        session.add(VehicleModel(vehicle_id=vid, vehicle_type=vtype, status='IDLE'))
-
     # Assign fresh route
-    session.query(Routes).filter_by(vehicle_id=vid).delete()
     route_length = random.randint(2, 5)
-    stops = random.sample(PLACE_IDS, route_length)
-    for step, place_id in enumerate(stops):
-        session.add(Routes(vehicle_id=vid, step_index=step, place_id=place_id))
-
-    print(f"{vid} assigned route: {stops}")
+    routes[vid] = random.sample(PLACE_IDS, route_length)
+    print(f"{vid} assigned route: {routes[vid]}")
+
+# One existence query, one DELETE and one executemany INSERT per table, however many vehicles there are
+existing = set(session.scalars(select(VehicleModel.vehicle_id).where(VehicleModel.vehicle_id.in_(vehicles))))
+new_vehicles = [
+    {"vehicle_id": vid, "vehicle_type": vid[0], "status": "IDLE"}
+    for vid in vehicles if vid not in existing
+]
+if new_vehicles:
+    session.execute(insert(VehicleModel), new_vehicles)
+
+session.execute(delete(Routes).where(Routes.vehicle_id.in_(vehicles)))
+session.execute(insert(Routes), [
+    {"vehicle_id": vid, "step_index": step, "place_id": place_id}
+    for vid, stops in routes.items()
+    for step, place_id in enumerate(stops)
+])
 
 session.commit()
 session.close()
 
+# All vehicles share this process, its event loop and the batched beacon socket
 print("Launching all vehicles...")
-for vid in vehicles:
-    subprocess.Popen(["python", "Vehicle.py", vid])
-    time.sleep(0.5)
+# ...and one TCP connection to the server
+mux = TransitClientMux(("localhost", 8000))
+fleet = [create_vehicle(vid, "localhost", 8000, 8001, mux=mux) for vid in vehicles]
+try:
+    asyncio.run(run_fleet(fleet, stagger=0.5))
+finally:
+    mux.close()
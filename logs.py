@@ -0,0 +1,26 @@
+# logs.py
+# Process-wide console logging for the server and the vehicles. Records are handed to a
+# queue and written to stdout by a single listener thread, so socket, beacon and route
+# threads never block on console I/O.
+
+import atexit
+import logging
+import os
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+_root = logging.getLogger("transit")
+# e.g. TRANSIT_LOG_LEVEL=WARNING silences the per-message INFO lines of a busy server or fleet
+_root.setLevel(os.environ.get("TRANSIT_LOG_LEVEL", "INFO").upper())
+_root.propagate = False
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_root.addHandler(QueueHandler(_log_queue))
+_log_listener = QueueListener(_log_queue, logging.StreamHandler(sys.stdout))
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """A logger under "transit", so it shares the queue and its listener thread."""
+    return logging.getLogger(f"transit.{name}")
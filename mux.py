@@ -0,0 +1,112 @@
+# mux.py
+# One TCP connection to the server shared by every vehicle of an asyncio fleet.
+# Frames already carry the vehicle ID, and the server answers every frame exactly
+# once and in order, so replies are matched to their senders first-in, first-out.
+
+import asyncio
+import socket
+from collections import deque
+from typing import Callable
+
+from protocol import FRAME_HEADER, FrameError, encode_frame, pop_frames
+
+
+class TransitClientMux:
+    SOCKET_BUFFER_SIZE = 4_000_000  # bytes; carries the traffic of the whole fleet
+
+    def __init__(self, address: tuple[str, int]):
+        self.sock = socket.create_connection(address)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.SOCKET_BUFFER_SIZE)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.SOCKET_BUFFER_SIZE)
+        self.sock.setblocking(False)
+        self.closed = False
+        # One entry per frame sent, in send order: a future awaiting the reply, a callback for an
+        # error reply, or None to drop it
+        self._waiters: deque[asyncio.Future | Callable[[str], None] | None] = deque()
+        self._send_lock: asyncio.Lock | None = None
+        self._reader: asyncio.Task | None = None
+
+    def _start(self) -> None:
+        # Created lazily so they bind to the loop the fleet actually runs on
+        if self._reader is None:
+            self._send_lock = asyncio.Lock()
+            self._reader = asyncio.get_running_loop().create_task(self._read_loop())
+
+    async def request(self, payload: bytes) -> str:
+        """Send one framed request and wait for its reply; returns "" if the connection is gone."""
+        self._start()
+        if self.closed:
+            return ""
+        reply = asyncio.get_running_loop().create_future()
+        if not await self._send(encode_frame(payload), [reply]):
+            return ""
+        return await reply
+
+    async def send_frames(self, frames: bytes | bytearray, on_error: Callable[[str], None] | None = None) -> bool:
+        """Send already-framed messages without waiting for their replies, e.g. status updates.
+
+        Acknowledgements are dropped; an ERROR reply to any of the frames is passed to `on_error`.
+        """
+        self._start()
+        if self.closed:
+            return False
+        count = 0
+        offset = 0
+        while offset < len(frames):
+            (length,) = FRAME_HEADER.unpack_from(frames, offset)
+            offset += FRAME_HEADER.size + length
+            count += 1
+        return await self._send(frames, [on_error] * count)
+
+    async def _send(self, data, waiters: list) -> bool:
+        # The lock keeps frames from interleaving and the waiter queue in the same order as the bytes
+        async with self._send_lock:
+            self._waiters.extend(waiters)
+            try:
+                await asyncio.get_running_loop().sock_sendall(self.sock, data)
+                return True
+            except OSError:
+                self._fail_waiters()
+                return False
+
+    async def _read_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        buf = bytearray(4096)
+        view = memoryview(buf)
+        pending = bytearray()
+        try:
+            while True:
+                n = await loop.sock_recv_into(self.sock, view)
+                if not n:
+                    break
+                pending += view[:n]
+                for frame in pop_frames(pending):
+                    waiter = self._waiters.popleft() if self._waiters else None
+                    if waiter is None:
+                        continue
+                    if isinstance(waiter, asyncio.Future):
+                        if not waiter.done():
+                            waiter.set_result(frame.decode(errors="replace"))
+                    elif frame.startswith(b"ERROR"):
+                        waiter(frame.decode(errors="replace"))
+        except (OSError, FrameError):
+            pass
+        finally:
+            self._fail_waiters()
+
+    def _fail_waiters(self) -> None:
+        self.closed = True
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if isinstance(waiter, asyncio.Future) and not waiter.done():
+                waiter.set_result("")
+
+    def close(self) -> None:
+        self.closed = True
+        if self._reader is not None:
+            self._reader.cancel()
+        try:
+            self.sock.close()
+        except OSError:
+            pass
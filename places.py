@@ -1,27 +1,237 @@
 # places.py
 
-from datetime import datetime, timedelta
-from Database import get_db_session, Place, PlaceOccupancy
+from datetime import datetime
+from Database import ReadSession, SessionLocal, Place, PlaceOccupancy
+from sqlalchemy import String, bindparam, func, or_, select
+from math import asin, cos, radians, sin, sqrt
+import threading
+import time
+import uuid
+
+PLACE_CACHE_TTL_SECONDS = 60
+PLACE_FULL_CACHE_TTL_SECONDS = 0.2
+DEFAULT_STAY_SECONDS = 60  # for places without a stay_time_seconds
+EARTH_RADIUS_M = 6_371_000.0
+
+
+class _TTLCache:
+    """Small thread-safe dict whose entries expire `ttl` seconds after they were stored."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            stored_at, value = entry
+            if time.monotonic() - stored_at >= self.ttl:
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# A place by ID, for cache misses; built once like the statements below
+PLACE_BY_ID = select(Place).where(Place.place_id == bindparam("place_id"))
+
+# Vehicles currently at a place; built once and reused by the capacity checks
+OCCUPANT_COUNT = (
+    select(func.count())
+    .select_from(PlaceOccupancy)
+    .where(PlaceOccupancy.place_id == bindparam("place_id"))
+)
+
+# Adds an occupancy only while the place is below its max_capacity (or has none); the count and the
+# insert are one statement, so a capacity check costs no extra round trip and two vehicles can't both
+# take the last spot. Capacity and stay time are read from the places row, never from a cached Place,
+# and both timestamps come from the database clock, in the same format SQLAlchemy writes DateTimes.
+_occupancy = PlaceOccupancy.__table__
+_places = Place.__table__
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%f"
+_db_now = func.strftime(_TIMESTAMP_FORMAT, "now")
+ENTER_IF_ROOM = _occupancy.insert().from_select(
+    ["occupancy_id", "vehicle_id", "place_id", "entered_at", "leave_after"],
+    select(
+        bindparam("occupancy_id", type_=String),
+        bindparam("vehicle_id", type_=String),
+        bindparam("place_id", type_=String),
+        _db_now,
+        func.strftime(
+            _TIMESTAMP_FORMAT, "now",
+            func.printf("+%d seconds", func.coalesce(_places.c.stay_time_seconds, DEFAULT_STAY_SECONDS)),
+        ),
+    ).where(
+        _places.c.place_id == bindparam("place_id"),
+        or_(_places.c.max_capacity.is_(None), OCCUPANT_COUNT.scalar_subquery() < _places.c.max_capacity),
+    ),
+)
+
+# Departures delete and report in one statement, instead of selecting the rows and deleting them one by one
+EXPIRED_DELETE = (
+    _occupancy.delete()
+    .where(_occupancy.c.occupancy_id.in_(
+        select(_occupancy.c.occupancy_id)
+        .where(_occupancy.c.leave_after <= _db_now)
+        .limit(bindparam("batch_size"))
+    ))
+    .returning(_occupancy.c.vehicle_id, _occupancy.c.place_id)
+)
+VEHICLE_DEPARTURE = (
+    _occupancy.delete()
+    .where(_occupancy.c.occupancy_id == (
+        select(_occupancy.c.occupancy_id)
+        .where(_occupancy.c.vehicle_id == bindparam("vehicle_id"))
+        .limit(1)
+        .scalar_subquery()
+    ))
+    .returning(_occupancy.c.place_id)
+)
+
+# Places are reference data, so lookups are served from memory for a short while
+_place_cache = _TTLCache(PLACE_CACHE_TTL_SECONDS)
 
 # Utility: Get a place by its ID
 def get_place_by_id(place_id: str):
-    with get_db_session() as session:
-        return session.query(Place).filter_by(place_id=place_id).first()
+    place = _place_cache.get(place_id)
+    if place is not None:
+        return place
+    with ReadSession() as session:
+        place = session.execute(PLACE_BY_ID, {"place_id": place_id}).scalar()
+    if place is not None:
+        _place_cache.set(place_id, place)
+    return place
+
+# Utility: Get several places at once; cache misses are fetched with a single IN query
+def get_places_by_ids(place_ids) -> dict:
+    places = {}
+    missing = []
+    for place_id in set(place_ids):
+        place = _place_cache.get(place_id)
+        if place is not None:
+            places[place_id] = place
+        else:
+            missing.append(place_id)
+    if missing:
+        with ReadSession() as session:
+            fetched = session.query(Place).filter(Place.place_id.in_(missing)).all()
+        for place in fetched:
+            _place_cache.set(place.place_id, place)
+            places[place.place_id] = place
+    return places
+
+# Utility: Drop a cached place after it has been changed in the database
+def invalidate_place(place_id: str | None = None):
+    if place_id is None:
+        _place_cache.clear()
+    else:
+        _place_cache.pop(place_id)
+
+# Utility: Great-circle distance in meters between two (lat, lon) points
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * asin(sqrt(a))
+
+class SpatialGrid:
+    """Last known positions of the vehicles in this process, bucketed into CELL_SIZE-degree cells."""
+
+    CELL_SIZE = 0.0001
+
+    def __init__(self):
+        self._pos: dict[str, tuple[float, float, tuple[int, int]]] = {}  # vehicle_id -> (lat, lon, cell)
+        self._cells: dict[tuple[int, int], set[str]] = {}
+        self._changed = threading.Condition()
+
+    def _cell(self, lat: float, lon: float) -> tuple[int, int]:
+        return round(lat / self.CELL_SIZE), round(lon / self.CELL_SIZE)
+
+    def _discard(self, vehicle_id: str, cell: tuple[int, int]) -> None:
+        members = self._cells[cell]
+        members.discard(vehicle_id)
+        if not members:
+            del self._cells[cell]
+
+    def update(self, vehicle_id: str, lat: float, lon: float) -> None:
+        cell = self._cell(lat, lon)
+        with self._changed:
+            old = self._pos.get(vehicle_id)
+            if old is not None and old[:2] == (lat, lon):
+                return
+            if old is not None and old[2] != cell:
+                self._discard(vehicle_id, old[2])
+            self._pos[vehicle_id] = (lat, lon, cell)
+            self._cells.setdefault(cell, set()).add(vehicle_id)
+            self._changed.notify_all()
+
+    def remove(self, vehicle_id: str) -> None:
+        with self._changed:
+            old = self._pos.pop(vehicle_id, None)
+            if old is not None:
+                self._discard(vehicle_id, old[2])
+                self._changed.notify_all()
+
+    def occupied(self, vehicle_id: str, lat: float, lon: float) -> bool:
+        """True if another vehicle is within CELL_SIZE degrees of (lat, lon) on both axes."""
+        ci, cj = self._cell(lat, lon)
+        with self._changed:
+            # Anything that close is in the same cell or one of its eight neighbours
+            for i in (ci - 1, ci, ci + 1):
+                for j in (cj - 1, cj, cj + 1):
+                    for other in self._cells.get((i, j), ()):
+                        if other == vehicle_id:
+                            continue
+                        other_lat, other_lon, _ = self._pos[other]
+                        if abs(other_lat - lat) <= self.CELL_SIZE and abs(other_lon - lon) <= self.CELL_SIZE:
+                            return True
+        return False
+
+    def wait_for_change(self, timeout: float) -> bool:
+        """Block until some vehicle moves or leaves the grid, or `timeout` seconds pass."""
+        with self._changed:
+            return self._changed.wait(timeout)
+
+
+# Shared by every vehicle running in this process
+vehicle_grid = SpatialGrid()
 
 # Utility: Check if a place is full
+# Answers are shared for a moment so vehicles polling the same place cost one query per window;
+# entries and departures drop the entry so a change is seen right away
+_place_full_cache = _TTLCache(PLACE_FULL_CACHE_TTL_SECONDS)
+
 def is_place_full(place_id: str) -> bool:
-    session = get_db_session()
+    full = _place_full_cache.get(place_id)
+    if full is not None:
+        return full
+
     place = get_place_by_id(place_id)
     if not place or place.max_capacity is None:
         return False  # If no capacity is defined, the place is never full
 
-    current = session.query(PlaceOccupancy).filter_by(place_id=place_id).count()
-    session.close()
-    return current >= place.max_capacity
+    with ReadSession() as session:
+        current = session.execute(OCCUPANT_COUNT, {"place_id": place_id}).scalar_one()
+    full = current >= place.max_capacity
+    _place_full_cache.set(place_id, full)
+    return full
 
 # Vehicle tries to enter a place
 def try_enter_place(vehicle_id: str, place_id: str) -> tuple[bool, str]:
-    session = get_db_session()
     place = get_place_by_id(place_id)
     if not place:
         return False, "INVALID_PLACE"
@@ -29,35 +239,101 @@ def try_enter_place(vehicle_id: str, place_id: str) -> tuple[bool, str]:
     if place.pass_through:
         return True, "PASSTHROUGH"
 
-    if is_place_full(place_id):
-        return False, "FULL"
-
-    leave_time = datetime.utcnow() + timedelta(seconds=place.stay_time_seconds or 60)
-    entry = PlaceOccupancy(vehicle_id=vehicle_id, place_id=place_id, leave_after=leave_time)
-    session.add(entry)
-    session.commit()
+    params = {"occupancy_id": str(uuid.uuid4()), "vehicle_id": vehicle_id, "place_id": place_id}
+    # Capacity is checked by the insert itself, so callers don't need is_place_full first
+    with SessionLocal() as session:
+        if not session.execute(ENTER_IF_ROOM, params).rowcount:
+            return False, "FULL"
+        session.commit()
+    _place_full_cache.pop(place_id)
     return True, "ENTERED"
 
 
 # Get vehicles that should now leave (expired stay time)
 def get_expired_occupants():
-    session = get_db_session()
-    return session.query(PlaceOccupancy).filter(PlaceOccupancy.leave_after <= datetime.utcnow()).all()
+    with ReadSession() as session:
+        return session.query(PlaceOccupancy).filter(PlaceOccupancy.leave_after <= _db_now).all()
+
+
+# Get occupants whose stay ends in [lo, hi), e.g. for windowed sweeps.
+# Keep the bounds on the bare column: wrapping it (func.date(PlaceOccupancy.leave_after) and the like)
+# stops SQLite from using ix_place_occupancy_leave_after and turns the range search into a full scan.
+def get_occupants_expiring_between(lo: datetime, hi: datetime):
+    with ReadSession() as session:
+        return (
+            session.query(PlaceOccupancy)
+            .filter(PlaceOccupancy.leave_after >= lo, PlaceOccupancy.leave_after < hi)
+            .all()
+        )
+
+
+# Remove every occupant whose stay has expired; returns the (vehicle_id, place_id) pairs removed.
+# Deletes at most `batch_size` rows per transaction, so a large backlog never holds the write lock for long
+def sweep_expired(batch_size: int = 1000) -> list[tuple[str, str]]:
+    removed = []
+    with SessionLocal() as session:
+        while True:
+            batch = [tuple(row) for row in session.execute(EXPIRED_DELETE, {"batch_size": batch_size})]
+            session.commit()
+            removed += batch
+            if len(batch) < batch_size:
+                break
+    for place_id in {place_id for _, place_id in removed}:
+        _place_vacated(place_id)
+    return removed
 
 
 # Remove a vehicle from a place
 def remove_vehicle_from_place(vehicle_id: str):
-    session = get_db_session()
-    occupancy = session.query(PlaceOccupancy).filter_by(vehicle_id=vehicle_id).first()
-    if occupancy:
-        session.delete(occupancy)
+    with SessionLocal() as session:
+        place_id = session.execute(VEHICLE_DEPARTURE, {"vehicle_id": vehicle_id}).scalar()
         session.commit()
-        return True
-    return False
+    if place_id is None:
+        return False
+    _place_vacated(place_id)
+    return True
+
+
+# Let the capacity cache and vehicles waiting on the place see that someone left
+def _place_vacated(place_id: str):
+    _place_full_cache.pop(place_id)
+    cv = _place_condition(place_id)
+    with cv:
+        cv.notify_all()
+
+
+# One condition per place, notified whenever a vehicle leaves it
+_place_events: dict[str, threading.Condition] = {}
+_place_events_lock = threading.Lock()
+
+def _place_condition(place_id: str) -> threading.Condition:
+    with _place_events_lock:
+        cv = _place_events.get(place_id)
+        if cv is None:
+            cv = _place_events[place_id] = threading.Condition()
+        return cv
+
+# Block until a vehicle in this process leaves the place, or `timeout` seconds pass.
+# Departures made by other processes are only seen once the timeout expires.
+def wait_for_departure(place_id: str, timeout: float) -> bool:
+    cv = _place_condition(place_id)
+    with cv:
+        return cv.wait(timeout)
+
+# Every place as (place_id, name, type, max_capacity, stay_time_seconds, pass_through) rows,
+# streamed so memory stays flat however many places there are
+def iter_places():
+    query = select(
+        Place.place_id, Place.name, Place.type, Place.max_capacity, Place.stay_time_seconds, Place.pass_through
+    ).execution_options(yield_per=500)
+    with ReadSession() as session:
+        yield from session.execute(query)
 
-# Optional: Debug list of all places
+# Optional: Debug list of all places, written to stdout in one call
 def list_all_places():
-    session = get_db_session()
-    places = session.query(Place).all()
-    for p in places:
-        print(f"[{p.place_id}] {p.name} | Type: {p.type} | Cap: {p.max_capacity} | Stay: {p.stay_time_seconds}s | PT: {p.pass_through}")
+    lines = [
+        f"[{p.place_id}] {p.name} | Type: {p.type} | Cap: {p.max_capacity} | Stay: {p.stay_time_seconds}s | PT: {p.pass_through}"
+        for p in iter_places()
+    ]
+    if lines:
+        print("\n".join(lines))
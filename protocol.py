@@ -0,0 +1,109 @@
+# protocol.py
+# TCP wire format shared by the server and vehicles.
+# Every message is framed as <4-byte big-endian length><payload bytes>.
+
+import struct
+
+FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME_SIZE = 64 * 1024  # anything larger is treated as a corrupt stream
+
+
+class FrameError(Exception):
+    pass
+
+
+def encode_frame(payload: bytes) -> bytes:
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def pop_frames(buf: bytearray) -> list[bytes]:
+    """Remove and return every complete frame at the front of `buf`; a trailing partial frame is left in place."""
+    frames = []
+    offset = 0
+    with memoryview(buf) as view:
+        while len(buf) - offset >= FRAME_HEADER.size:
+            (length,) = FRAME_HEADER.unpack_from(buf, offset)
+            if length > MAX_FRAME_SIZE:
+                raise FrameError(f"Frame of {length} bytes exceeds the {MAX_FRAME_SIZE} byte limit")
+            end = offset + FRAME_HEADER.size + length
+            if end > len(buf):
+                break
+            frames.append(view[offset + FRAME_HEADER.size:end].tobytes())
+            offset = end
+    del buf[:offset]
+    return frames
+
+
+# Binary UPDATE_LOCATION frames. Text frames always start with a vehicle ID, so a
+# leading opcode byte can't be mistaken for one. Layout:
+#   opcode:u8 | id_len:u8 | id | session_len:u16 | session | lat:f64 | lon:f64 | state:u8
+OP_UPDATE_LOCATION = 0x01
+VEHICLE_STATES = ("IDLE", "MOVING", "WAITING", "DELAYED", "FINISHED")
+STATE_CODES = {state: code for code, state in enumerate(VEHICLE_STATES)}
+
+_ID_HEADER = struct.Struct("!BB")
+_SESSION_HEADER = struct.Struct("!H")
+LOCATION_BODY = struct.Struct("!ddB")
+
+
+def update_location_prefix(vehicle_id: str, session_id: str) -> bytes:
+    """The part of a binary UPDATE_LOCATION payload that stays fixed for a session."""
+    vid = vehicle_id.encode()
+    session = session_id.encode()
+    return _ID_HEADER.pack(OP_UPDATE_LOCATION, len(vid)) + vid + _SESSION_HEADER.pack(len(session)) + session
+
+
+def decode_update_location(payload: bytes) -> tuple[str, str, float, float, str]:
+    """Returns (vehicle_id, session_id, latitude, longitude, state) from a binary UPDATE_LOCATION payload."""
+    try:
+        _, vid_len = _ID_HEADER.unpack_from(payload, 0)
+        offset = _ID_HEADER.size + vid_len
+        (session_len,) = _SESSION_HEADER.unpack_from(payload, offset)
+        offset += _SESSION_HEADER.size
+        session_end = offset + session_len
+        latitude, longitude, state = LOCATION_BODY.unpack_from(payload, session_end)
+        vehicle_id = payload[_ID_HEADER.size:_ID_HEADER.size + vid_len].decode()
+        session_id = payload[offset:session_end].decode()
+        return vehicle_id, session_id, latitude, longitude, VEHICLE_STATES[state]
+    except (struct.error, UnicodeDecodeError, IndexError) as e:
+        raise FrameError(f"Malformed UPDATE_LOCATION frame: {e}") from e
+
+
+# Binary UDP beacons. Text beacons ("<id>/<lon>/<lat>") always start with an ID character,
+# so a leading opcode byte marks this form. Layout:
+#   opcode:u8 | id_len:u8 | id | lon:i32 | lat:i32
+# Coordinates are fixed-point degrees * BEACON_SCALE (~1 cm resolution, and +-180 degrees
+# fits in an int32), half the size of two doubles.
+# Trailing bytes are ignored, so senders may pad beacons to a common size.
+OP_BEACON = 0x02
+BEACON_BODY = struct.Struct("!ii")
+BEACON_SCALE = 10_000_000
+
+
+def beacon_prefix(vehicle_id: str) -> bytes:
+    """The fixed part of a vehicle's binary beacon; the coordinates follow, packed by pack_beacon_into()."""
+    vid = vehicle_id.encode()
+    return _ID_HEADER.pack(OP_BEACON, len(vid)) + vid
+
+
+def pack_beacon_into(buf: bytearray, offset: int, longitude: float, latitude: float) -> None:
+    """Write fixed-point coordinates into a beacon buffer; raises FrameError if they can't be encoded."""
+    try:
+        BEACON_BODY.pack_into(buf, offset, round(longitude * BEACON_SCALE), round(latitude * BEACON_SCALE))
+    except (struct.error, ValueError, OverflowError) as e:
+        raise FrameError(f"Coordinates can't be encoded in a beacon: {e}") from e
+
+
+def decode_beacon(payload: bytes) -> tuple[str, float, float]:
+    """Returns (vehicle_id, longitude, latitude) from a binary beacon."""
+    try:
+        _, vid_len = _ID_HEADER.unpack_from(payload, 0)
+        longitude, latitude = BEACON_BODY.unpack_from(payload, _ID_HEADER.size + vid_len)
+        longitude /= BEACON_SCALE
+        latitude /= BEACON_SCALE
+        vehicle_id = payload[_ID_HEADER.size:_ID_HEADER.size + vid_len].decode("ascii")
+    except (struct.error, UnicodeDecodeError) as e:
+        raise FrameError(f"Malformed beacon: {e}") from e
+    if not vehicle_id.isalnum() or abs(longitude) > 180 or abs(latitude) > 90:
+        raise FrameError("Malformed beacon: bad vehicle ID or coordinates out of range")
+    return vehicle_id, longitude, latitude
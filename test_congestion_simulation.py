@@ -1,6 +1,8 @@
-import subprocess
-import time
+import asyncio
+from sqlalchemy import delete, insert, select
 from Database import get_db_session, Vehicle as VehicleModel, Routes, Place
+from Vehicle import create_vehicle, run_fleet
+from mux import TransitClientMux
 
 # Parameters
 NUM_VEHICLES = 5  # Number of vehicles to simulate
@@ -35,32 +37,42 @@ vehicles = []
 print("Generating vehicles and assigning routes...")
 for i in range(NUM_VEHICLES):
     vtype = VEHICLE_TYPES[i % len(VEHICLE_TYPES)]
-    vid = f"{vtype}{100 + i}"
-    vehicles.append(vid)
+    vehicles.append(f"{vtype}{100 + i}")
 
-    # Add vehicle to the database if it doesn't exist
-    existing = session.query(VehicleModel).filter_by(vehicle_id=vid).first()
-    if not existing:
-        session.add(VehicleModel(vehicle_id=vid, vehicle_type=vtype, status='IDLE'))
+# Every route includes the test place
+route = [PLACE_ID] + [f"P00{i+2}" for i in range(ROUTE_LENGTH - 1)]  # Route starts with PLACE_ID
 
-    # Assign a route that includes the test place
-    session.query(Routes).filter_by(vehicle_id=vid).delete()  # Clear existing routes
-    route = [PLACE_ID] + [f"P00{i+2}" for i in range(ROUTE_LENGTH - 1)]  # Route starts with PLACE_ID
-    for step, place_id in enumerate(route):
-        session.add(Routes(vehicle_id=vid, step_index=step, place_id=place_id))
+# One existence query, one DELETE and one executemany INSERT per table, however many vehicles there are
+existing = set(session.scalars(select(VehicleModel.vehicle_id).where(VehicleModel.vehicle_id.in_(vehicles))))
+new_vehicles = [
+    {"vehicle_id": vid, "vehicle_type": vid[0], "status": "IDLE"}
+    for vid in vehicles if vid not in existing
+]
+if new_vehicles:
+    session.execute(insert(VehicleModel), new_vehicles)
 
+session.execute(delete(Routes).where(Routes.vehicle_id.in_(vehicles)))  # Clear existing routes
+session.execute(insert(Routes), [
+    {"vehicle_id": vid, "step_index": step, "place_id": place_id}
+    for vid in vehicles
+    for step, place_id in enumerate(route)
+])
+for vid in vehicles:
     print(f"{vid} assigned route: {route}")
 
 # Commit changes to the database
 session.commit()
 session.close()
 
-# Launch vehicles
-print("Launching vehicles...")
-for vid in vehicles:
-    subprocess.Popen(["python", "Vehicle.py", vid])
-    time.sleep(0.5)  # Slight delay between launches to simulate staggered starts
-
 # Monitor the simulation
 print("Simulation started. Monitor the logs to observe congestion behavior.")
-print("Vehicles should wait their turn to enter the place if it is full.")
\ No newline at end of file
+print("Vehicles should wait their turn to enter the place if it is full.")
+
+# Launch vehicles in this process, staggered to simulate separate starts
+print("Launching vehicles...")
+mux = TransitClientMux(("localhost", 8000))
+fleet = [create_vehicle(vid, "localhost", 8000, 8001, mux=mux) for vid in vehicles]
+try:
+    asyncio.run(run_fleet(fleet, stagger=0.5))
+finally:
+    mux.close()
\ No newline at end of file
@@ -3,8 +3,10 @@ from places import (
     try_enter_place,
     is_place_full,
     get_expired_occupants,
+    get_occupants_expiring_between,
     remove_vehicle_from_place
 )
+from datetime import datetime, timedelta
 import time
 
 def test_flow():
@@ -37,6 +39,11 @@ def test_flow():
     for occ in expired:
         print(f"- {occ.vehicle_id} at {occ.place_id}, leave after {occ.leave_after}")
 
+    print("\n🕒 Occupants leaving within the next 3 minutes (should be the 5 in P001):")
+    now = datetime.utcnow()
+    leaving = get_occupants_expiring_between(now, now + timedelta(minutes=3))
+    print(f"Leaving soon: {len(leaving)} occupant(s)")
+
     print("\n🧹 Manually removing all 5 vehicles from P001:")
     for i in range(1, 6):
         vid = f"B10{i}"
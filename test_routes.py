@@ -1,8 +1,8 @@
-from Database import get_db_session, Routes
+from Database import SessionLocal, Routes
 
 def test_routes(vehicle_id: str):
-    session = get_db_session()
-    steps = session.query(Routes).filter_by(vehicle_id=vehicle_id).order_by(Routes.step_index).all()
+    with SessionLocal() as session:
+        steps = session.query(Routes).filter_by(vehicle_id=vehicle_id).order_by(Routes.step_index).all()
 
     print(f"📍 Route for {vehicle_id}:")
     for step in steps:
@@ -11,3 +11,4 @@ def test_routes(vehicle_id: str):
 if __name__ == "__main__":
     test_routes("B101")
     test_routes("B102")
+    SessionLocal.remove()